@@ -28,7 +28,7 @@ class Backend:
         pass
 
 
-    class InvoiceData(Struct):
+    class InvoiceData(Struct, frozen=True):
         creationTime = None          #int, UNIX timestamp
         expirationTime = None        #int, UNIX timestamp
         min_final_cltv_expiry = None #int
@@ -41,7 +41,7 @@ class Backend:
 
 
 
-    class Invoice(Struct):
+    class Invoice(Struct, frozen=True):
         label = None          #str
         status = None         #str
         bolt11 = None         #str, BOLT 11
@@ -49,7 +49,7 @@ class Backend:
 
 
 
-    class Payment(Struct):
+    class Payment(Struct, frozen=True):
         amount = None          #int, mSatoshi
         currency = None        #str, BIP-173
         label = None           #str
@@ -60,7 +60,7 @@ class Backend:
         paymentPreimage = None #str
 
 
-    class Channel(Struct):
+    class Channel(Struct, frozen=True):
         channelID      = None #Backend.ChannelID
         state          = None #str
         operational    = None #bool
@@ -70,10 +70,10 @@ class Backend:
         peerFunds      = None #int, mSatoshi
 
 
-    class Peer(Struct):
+    class Peer(Struct, frozen=True):
         peerID = None    #str
         alias = None     #str
         color = None     #str
         connected = None #bool
-        channels = []    #list of Channel
+        channels = ()    #tuple of Channel
 
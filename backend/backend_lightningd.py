@@ -18,11 +18,15 @@
 import os.path
 import logging
 import json
+import threading
+import time
 
 from utils.struct import Struct
+from utils import bolt11decoder
+from utils.ttlcache import TTLCache
 
 from .backend_base import Backend as Backend_Base
-from .lightningd.lightning import LightningRpc
+from .lightningd.lightning import LightningRpc, RpcError
 
 
 
@@ -30,24 +34,43 @@ def translateRPCExceptions(method):
     def newMethod(self, *args, **kwargs):
         try:
             return method(self, *args, **kwargs)
-        except (ConnectionRefusedError, ConnectionResetError) as e:
+        except (ConnectionRefusedError, ConnectionResetError, BrokenPipeError) as e:
             raise self.NotConnected(str(e))
     return newMethod
 
 
 
 class Backend(Backend_Base):
-    class ChannelID(Struct):
+    class ChannelID(Struct, frozen=True):
         peerID = None #str
 
 
+    #Getter method -> the RPC call whose result it uses
+    prefetchedRPCs = \
+    {
+    'isConnected'       : 'getinfo',
+    'getPeers'          : 'listpeers',
+    'getFunds'          : 'listfunds',
+    'getNonChannelFunds': 'listfunds',
+    'getChannelFunds'   : 'listfunds',
+    'getPayments'       : 'listsendpays',
+    }
+
+    #Maximum time (seconds) for a single waitanyinvoice call.
+    #Between calls, expired invoices are detected.
+    invoicePollTimeout = 10
+
+    #Console commands that can make or delete invoices:
+    invoiceCommands = {'invoice', 'delinvoice', 'delexpiredinvoice', 'autocleaninvoice'}
+
+
     def __init__(self, config):
         logging.info('Using Lightningd back-end')
         self.config = config
 
 
     def setFrontend(self, frontend):
-        pass #unused
+        self.frontend = frontend
 
 
     def startup(self):
@@ -56,9 +79,29 @@ class Backend(Backend_Base):
         lightningDir = os.path.abspath(lightningDir)
         lightningFile = self.config.getValue('lightningd', 'file')
         socketFile = os.path.join(lightningDir, lightningFile)
-        self.rpc = LightningRpc(socketFile)
+        #Unchanged responses give the same result objects as before, so
+        #their conversion can be re-used (see convertResult). Only for the
+        #polled calls, since the last result of each call is kept.
+        self.rpc = LightningRpc(socketFile, multiplexed=True,
+            reuse_results=set(self.prefetchedRPCs.values()))
+        self.prefetched = {}
+        self.convertedResults = {} #name -> (result, args, converted)
         self.initNodeInfo()
 
+        #Node aliases and colors rarely change, so they are cached:
+        self.nodeInfoCache = TTLCache(
+            float(self.config.getValue('core', 'nodeinfottl')),
+            int(self.config.getValue('core', 'nodeinfocachesize'))
+            )
+
+        #Invoices are kept locally, and updated with waitanyinvoice:
+        self.invoiceLock = threading.Lock()
+        self.invoices = None #dict label->Invoice, or None if not loaded
+        self.staleInvoices = None #the last loaded invoices, after a failure
+        self.invoicesVersion = 0 #incremented on every change of invoices
+        self.lastPayIndex = 0
+        threading.Thread(target=self.pollInvoices, daemon=True).start()
+
 
     def getBackendName(self):
         '''
@@ -84,11 +127,68 @@ class Backend(Backend_Base):
         return []
 
 
+    def prefetch(self, methods=None):
+        '''
+        Fetch, in a single round trip, the data that is needed by the given
+        getter methods. The getters will use this data instead of doing their
+        own RPC calls, until the next prefetch or a state-changing command.
+        Arguments:
+            methods: None or iterable of str
+                Names of the getter methods that will be called; if None,
+                the data of all getters is fetched.
+        Returns: None
+        Exceptions:
+            none (connection errors will be reported by the getters)
+        '''
+        if methods is None:
+            methods = self.prefetchedRPCs.keys()
+        #listinvoices is not needed: invoices are kept up to date by pollInvoices.
+        methods = sorted(set(
+            self.prefetchedRPCs[m] for m in methods if m in self.prefetchedRPCs
+            ))
+        self.prefetched = {}
+        if not methods:
+            return
+        try:
+            results = self.rpc.call_batch([(m, None) for m in methods])
+        except (OSError, ValueError):
+            return
+        self.prefetched = dict(zip(methods, results))
+
+
+    def callRPC(self, method):
+        #Argument-less RPC call, answered from the prefetched data if possible
+        try:
+            return self.prefetched[method]
+        except KeyError:
+            return getattr(self.rpc, method)()
+
+
+    def convertResult(self, name, convert, result, *args):
+        '''
+        Arguments:
+            name: str
+            convert: function
+            result: RPC result
+            *args: additional arguments of convert
+        Returns:
+            convert(result, *args). If result is the same object as the
+            previous time (because the RPC response was unchanged), and args
+            are equal, the previous return value is returned instead.
+        '''
+        previous = self.convertedResults.get(name)
+        if previous is not None and previous[0] is result and previous[1] == args:
+            return previous[2]
+        converted = convert(result, *args)
+        self.convertedResults[name] = (result, args, converted)
+        return converted
+
+
     def initNodeInfo(self):
         #Cached:
         try:
-            self.nodeInfo = self.rpc.getinfo()
-        except (ConnectionRefusedError, ConnectionResetError):
+            self.nodeInfo = self.callRPC('getinfo')
+        except (ConnectionRefusedError, ConnectionResetError, BrokenPipeError):
             self.nodeInfo = None
             return False
 
@@ -136,6 +236,19 @@ class Backend(Backend_Base):
             return getattr(self.rpc, cmd)(**kwargs)
         except (ValueError, TypeError) as e:
             raise Backend.CommandFailed(str(e))
+        finally:
+            if cmd in self.invoiceCommands:
+                #Not in this (GUI) thread, since it re-lists all invoices:
+                threading.Thread(
+                    target=self.reloadInvoicesInBackground, daemon=True).start()
+
+
+    def reloadInvoicesInBackground(self):
+        #Runs in a background thread.
+        try:
+            self.reloadInvoices()
+        except Exception as e:
+            logging.debug('Reloading invoices failed: %s' % str(e))
 
 
     def getNativeCurrency(self):
@@ -213,7 +326,10 @@ class Backend(Backend_Base):
         Exceptions:
             Backend.NotConnected: not connected to the backend
         '''
-        outputs = self.rpc.listfunds()['outputs']
+        return self.makeNonChannelFunds(self.callRPC('listfunds')['outputs'])
+
+
+    def makeNonChannelFunds(self, outputs):
         ret = {}
         for tx in outputs:
             ret[(tx['txid'], tx['output'])] = \
@@ -230,7 +346,32 @@ class Backend(Backend_Base):
         Exceptions:
             Backend.NotConnected: not connected to the backend
         '''
-        channels = self.rpc.listfunds()['channels']
+        return self.makeChannelFunds(self.callRPC('listfunds')['channels'])
+
+
+    @translateRPCExceptions
+    def getFunds(self):
+        '''
+        Arguments:
+        Returns: tuple(dict, list(Channel))
+            The non-channel funds and the channel funds, in the formats of
+            getNonChannelFunds and getChannelFunds.
+        Exceptions:
+            Backend.NotConnected: not connected to the backend
+        '''
+        #A single listfunds call contains both:
+        return self.convertResult('funds', self.makeFunds, self.callRPC('listfunds'))
+
+
+    def makeFunds(self, funds):
+        return \
+        (
+        self.makeNonChannelFunds(funds['outputs']),
+        self.makeChannelFunds(funds['channels'])
+        )
+
+
+    def makeChannelFunds(self, channels):
         ret = []
         for c in channels:
             ours =  1000*c['channel_sat']       #TODO: actual resolution
@@ -260,8 +401,12 @@ class Backend(Backend_Base):
             Backend.NotConnected: not connected to the backend
         '''
 
-        peers = self.rpc.listpeers()['peers']
+        peers = self.callRPC('listpeers')['peers']
+        nodeInfo = self.getNodeInfo(peers)
+        return self.convertResult('peers', self.makePeers, peers, nodeInfo)
+
 
+    def makePeers(self, peers, nodeInfo):
         ret = []
         for p in peers:
             channels = []
@@ -298,18 +443,56 @@ class Backend(Backend_Base):
                         lockedOutgoing=lockedOut,
                         peerFunds=theirs
                         ))
-            alias = p['alias'] if 'alias' in p else '(unknown)'
-            color = p['color'] if 'color' in p else 'ffffff'
+            alias, color = nodeInfo[p['id']]
             ret.append(Backend.Peer(
                 peerID=p['id'],
                 alias=alias,
                 color=color,
                 connected=p['connected'],
-                channels=channels
+                channels=tuple(channels)
                 ))
         return ret
 
 
+    def getNodeInfo(self, peers):
+        '''
+        Arguments:
+            peers: list(dict)
+                listpeers output
+        Returns: dict(str->(str, str))
+            peer ID -> (alias, color)
+        '''
+        ret = {}
+        missing = []
+        for p in peers:
+            peerID = p['id']
+            if 'alias' in p and 'color' in p:
+                #Older lightningd versions include it in listpeers:
+                ret[peerID] = (p['alias'], p['color'])
+                continue
+            info = self.nodeInfoCache.get(peerID)
+            if info is None:
+                missing.append(peerID)
+            else:
+                ret[peerID] = info
+
+        #Look up the missing ones in a single round-trip:
+        results = self.rpc.call_batch(
+            [('listnodes', {'id': peerID}) for peerID in missing]
+            ) if missing else []
+        for peerID, result in zip(missing, results):
+            nodes = result['nodes']
+            if nodes and 'alias' in nodes[0]:
+                info = (nodes[0]['alias'], nodes[0]['color'])
+                self.nodeInfoCache.set(peerID, info)
+            else:
+                #Not cached: it may get announced any moment
+                info = ('(unknown)', 'ffffff')
+            ret[peerID] = info
+
+        return ret
+
+
     @translateRPCExceptions
     def getInvoices(self):
         '''
@@ -319,26 +502,197 @@ class Backend(Backend_Base):
         Exceptions:
             Backend.NotConnected: not connected to the backend
         '''
-        invoices = self.rpc.listinvoices()['invoices']
+        with self.invoiceLock:
+            if self.invoices is not None:
+                return list(self.invoices.values())
+
+        return list(self.loadInvoices().values())
 
-        ret = []
-        for inv in invoices:
-            try:
-                data = self.decodeInvoiceData(inv['bolt11'])
-            except Backend.CommandFailed:
-                data = Backend.InvoiceData(
-                    expirationTime = inv['expires_at'],
-                    amount = inv['msatoshi'],
-                    currency = self.getNativeCurrency()
-                    )
 
-            ret.append(Backend.Invoice(
-                label=inv['label'],
-                status=inv['status'],
-                bolt11=inv['bolt11'],
-                data=data
+    @staticmethod
+    def pushesInvoiceUpdates():
+        '''
+        Arguments:
+        Returns: bool
+            True if this back-end calls the front-end's invoiceChanged method
+            for every new or changed invoice, and its invoiceRemoved method
+            for every removed invoice, so the invoice list only needs to be
+            retrieved once (and again after a connection loss).
+        '''
+        return True
+
+
+    def reloadInvoices(self):
+        '''
+        Re-lists the invoices, to find those that were made, changed or
+        deleted outside of this back-end (e.g. with lightning-cli), and
+        pushes the differences to the front-end.
+        Arguments:
+        Returns: None
+        Exceptions:
+            from the listinvoices call
+        '''
+        with self.invoiceLock:
+            if self.invoices is None and self.staleInvoices is None:
+                return #will be loaded in full later
+        self.loadInvoices()
+
+
+    def loadInvoices(self):
+        #Returns the loaded invoices (dict label->Invoice).
+        #If invoices were loaded before, the differences are pushed to the
+        #front-end, since updates may have been missed in between.
+        while True:
+            with self.invoiceLock:
+                version = self.invoicesVersion
+                oldInvoices = self.invoices
+                if oldInvoices is None:
+                    oldInvoices = self.staleInvoices
+                oldInvoices = {} if oldInvoices is None else dict(oldInvoices)
+
+            #Outside the lock, since this can take a while with many
+            #invoices. Only new or changed invoices are decoded.
+            invoices = self.callRPC('listinvoices')['invoices']
+            newInvoices = {}
+            for inv in invoices:
+                oldInv = oldInvoices.get(inv['label'])
+                if oldInv is not None and oldInv.bolt11 == inv['bolt11'] and \
+                        oldInv.status == self.getInvoiceStatus(inv, oldInv.data):
+                    newInvoices[oldInv.label] = oldInv
+                else:
+                    newInvoices[inv['label']] = self.makeInvoice(inv)
+
+            with self.invoiceLock:
+                if self.invoicesVersion != version:
+                    #Changed by another thread in the mean time, possibly
+                    #after our listinvoices call: try again.
+                    continue
+                isReload = self.invoices is not None or self.staleInvoices is not None
+                self.invoices = newInvoices
+                self.staleInvoices = None
+                self.invoicesVersion += 1
+                self.lastPayIndex = max(
+                    [inv.get('pay_index', 0) for inv in invoices], default=0)
+            break
+
+        if isReload:
+            for label, inv in newInvoices.items():
+                if oldInvoices.get(label) is not inv:
+                    self.frontend.invoiceChanged(inv)
+            for label, inv in oldInvoices.items():
+                if label not in newInvoices:
+                    self.frontend.invoiceRemoved(inv)
+        return newInvoices
+
+
+    def makeInvoice(self, inv):
+        #Our own invoices: the payee is us, so skip signature-based recovery
+        payee = None if self.nodeInfo is None else self.nodeInfo['id']
+        try:
+            data = bolt11decoder.decode(inv['bolt11'], payee=payee)
+        except ValueError:
+            data = Backend.InvoiceData(
+                expirationTime = inv['expires_at'],
+                amount = inv['msatoshi'],
+                currency = self.getNativeCurrency()
+                )
+
+        return Backend.Invoice(
+            label=inv['label'],
+            status=self.getInvoiceStatus(inv, data),
+            bolt11=inv['bolt11'],
+            data=data
+            )
+
+
+    @staticmethod
+    def getInvoiceStatus(inv, data):
+        #Same as updateExpiredInvoices, in case lightningd didn't notice yet:
+        status = inv['status']
+        if status == 'unpaid' and data.expirationTime <= time.time():
+            status = 'expired'
+        return status
+
+
+    def setInvoice(self, invoice):
+        with self.invoiceLock:
+            if self.invoices is None:
+                return #will be loaded in full later
+            self.invoices[invoice.label] = invoice
+            self.invoicesVersion += 1
+        self.frontend.invoiceChanged(invoice)
+
+
+    def updateExpiredInvoices(self):
+        now = time.time()
+        with self.invoiceLock:
+            if self.invoices is None:
+                return
+            expired = \
+            [
+            inv for inv in self.invoices.values()
+            if inv.status == 'unpaid' and inv.data.expirationTime <= now
+            ]
+        for inv in expired:
+            self.setInvoice(Backend.Invoice(
+                label=inv.label,
+                status='expired',
+                bolt11=inv.bolt11,
+                data=inv.data
                 ))
-        return ret
+
+
+    def pollInvoices(self):
+        #Runs in a background thread.
+        while True:
+            try:
+                with self.invoiceLock:
+                    invoices = self.invoices
+                if invoices is None:
+                    #Invoices may have changed while polling failed;
+                    #the differences are pushed by loadInvoices.
+                    self.loadInvoices()
+                with self.invoiceLock:
+                    lastPayIndex = self.lastPayIndex
+                    expirationTimes = \
+                    [
+                    inv.data.expirationTime for inv in self.invoices.values()
+                    if inv.status == 'unpaid'
+                    ]
+
+                timeout = self.invoicePollTimeout
+                if expirationTimes:
+                    timeout = min(timeout, min(expirationTimes) - time.time())
+                timeout = max(1, int(timeout))
+
+                startTime = time.time()
+                try:
+                    inv = self.rpc.waitanyinvoice(
+                        lastpay_index=lastPayIndex, timeout=timeout)
+                except RpcError:
+                    #Timeout
+                    if time.time() - startTime < timeout:
+                        #Some other error; don't keep lightningd busy
+                        time.sleep(1)
+                    #Invoices that were made or deleted by others:
+                    self.reloadInvoices()
+                    self.updateExpiredInvoices()
+                    continue
+
+                with self.invoiceLock:
+                    self.lastPayIndex = max(self.lastPayIndex, inv['pay_index'])
+                self.setInvoice(self.makeInvoice(inv))
+
+            except Exception as e:
+                logging.debug('Invoice polling failed: %s' % str(e))
+                with self.invoiceLock:
+                    #Reloaded on the next attempt; the differences are
+                    #pushed then.
+                    if self.invoices is not None:
+                        self.staleInvoices = self.invoices
+                    self.invoices = None
+                    self.invoicesVersion += 1
+                time.sleep(1)
 
 
     @translateRPCExceptions
@@ -350,13 +704,12 @@ class Backend(Backend_Base):
         Exceptions:
             Backend.NotConnected: not connected to the backend
         '''
-        payments = self.rpc.listsendpays()['payments']
+        payments = self.callRPC('listsendpays')['payments']
         currency = self.getNativeCurrency()
+        return self.convertResult('payments', self.makePayments, payments, currency)
 
-        for p in payments:
-        	data = self.decodeInvoiceData(p['bolt11'])
-        	p['destination'] = data.payee
 
+    def makePayments(self, payments, currency):
         return \
         [
         Backend.Payment(
@@ -365,14 +718,26 @@ class Backend(Backend_Base):
             amount=x['msatoshi'],
             currency=currency,
             status=x['status'],
-            destination=x['destination'],
+            destination=self.getDestination(x),
             paymentHash=x['payment_hash'],
-            paymentPreimage=x['payment_preimage']
+            paymentPreimage=x.get('payment_preimage')
             )
         for x in payments
         ]
 
 
+    @staticmethod
+    def getDestination(payment):
+        #listsendpays normally includes the destination.
+        #Only decode the bolt11 code if it doesn't.
+        if 'destination' in payment:
+            return payment['destination']
+        try:
+            return bolt11decoder.decode(payment['bolt11']).payee
+        except (KeyError, ValueError):
+            return None
+
+
     @translateRPCExceptions
     def makeNewInvoice(self, label, description, amount, expiry):
         '''
@@ -390,6 +755,7 @@ class Backend(Backend_Base):
             Backend.NotConnected: not connected to the backend
         '''
         try:
+            self.prefetched = {}
             data = self.rpc.invoice(
                 msatoshi=amount,
                 label=label,
@@ -399,10 +765,18 @@ class Backend(Backend_Base):
         except ValueError as e:
             raise Backend.CommandFailed(str(e))
 
+        self.setInvoice(self.makeInvoice(
+            {
+            'label': label,
+            'status': 'unpaid',
+            'bolt11': data['bolt11'],
+            'expires_at': data['expires_at'],
+            'msatoshi': amount
+            }))
+
         return data['bolt11']
 
 
-    @translateRPCExceptions
     def decodeInvoiceData(self, bolt11):
         '''
         Arguments:
@@ -412,26 +786,12 @@ class Backend(Backend_Base):
             Backend.CommandFailed: the command failed (e.g. invalid bolt11 code)
             Backend.NotConnected: not connected to the backend
         '''
+        #Decoded locally: no need to bother lightningd with this
         try:
-            result = self.rpc.decodepay(bolt11=bolt11)
+            return bolt11decoder.decode(bolt11)
         except ValueError as e:
             raise Backend.CommandFailed(str(e))
 
-		#TODO: support for bolt11 data that doesn't contain all fields
-        creationTime = result['created_at']
-        expirationTime = creationTime + result['expiry']
-        return Backend.InvoiceData(
-            creationTime=creationTime,
-            expirationTime=expirationTime,
-            min_final_cltv_expiry=result['min_final_cltv_expiry'],
-            amount=result['msatoshi'],
-            currency=result['currency'],
-            description=result['description'],
-            payee=result['payee'],
-            paymentHash=result['payment_hash'],
-            signature=result['signature']
-            )
-
 
     @translateRPCExceptions
     def pay(self, bolt11):
@@ -445,6 +805,7 @@ class Backend(Backend_Base):
         '''
         try:
             #TODO: support for the other arguments of pay
+            self.prefetched = {}
             self.rpc.pay(bolt11=bolt11)
         except ValueError as e:
             raise Backend.CommandFailed(str(e))
@@ -462,6 +823,7 @@ class Backend(Backend_Base):
             Backend.NotConnected: not connected to the backend
         '''
         try:
+            self.prefetched = {}
             self.rpc.connect(link)
         except ValueError as e:
             raise Backend.CommandFailed(str(e))
@@ -480,6 +842,7 @@ class Backend(Backend_Base):
             Backend.NotConnected: not connected to the backend
         '''
         try:
+            self.prefetched = {}
             self.rpc.fundchannel(peerID, amount // 1000)
         except ValueError as e:
             raise Backend.CommandFailed(str(e))
@@ -496,6 +859,7 @@ class Backend(Backend_Base):
             Backend.NotConnected: not connected to the backend
         '''
         try:
+            self.prefetched = {}
             self.rpc.close(channelID.peerID)
         except ValueError as e:
             raise Backend.CommandFailed(str(e))
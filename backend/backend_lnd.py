@@ -19,12 +19,16 @@ import logging
 import os
 import codecs
 import binascii
+import hashlib
 import json
 import time
+import threading
 
 import grpc
 
 from utils.struct import Struct
+from utils import bolt11decoder
+from utils.ttlcache import TTLCache
 
 from .lnd import rpc_pb2 as ln
 from .lnd import rpc_pb2_grpc as lnrpc
@@ -68,12 +72,45 @@ def translateRPCExceptions(method):
     return newMethod
 
 
+class FingerprintedFuture:
+    '''
+    Future of a fingerprinted command: decodes the response when the
+    result is retrieved.
+    '''
+    def __init__(self, backend, cmd, request, future):
+        self.backend = backend
+        self.cmd = cmd
+        self.request = request
+        self.future = future
+
+
+    def result(self):
+        return self.backend.decodeFingerprinted(
+            self.cmd, self.request, self.future.result())
+
+
 class Backend(Backend_Base):
-    class ChannelID(Struct):
+    class ChannelID(Struct, frozen=True):
         txID = None        #str
         outputIndex = None #int
 
 
+    #Maximum time (seconds) between checks for expired invoices
+    invoiceExpirationCheckInterval = 10
+
+    #Commands that are polled by the refreshes. Their responses are received
+    #undecoded and fingerprinted, so that an unchanged response is not
+    #decoded again: the previously decoded response is returned instead.
+    fingerprintedCommands = \
+    {
+    'GetInfo',
+    'WalletBalance',
+    'PendingChannels',
+    'ListChannels',
+    'ListPeers',
+    }
+
+
     def __init__(self, config):
         logging.info('Using LND back-end')
         self.config = config
@@ -109,6 +146,24 @@ class Backend(Backend_Base):
         self.nativeCurrency = None
         self.connectInProgress = False
 
+        self.rawMethods = {} #cmd -> method that returns the serialized response
+        self.lastResponses = {} #(cmd, serialized request) -> (fingerprint, response)
+        self.convertedResults = {} #name -> (responses, args, converted)
+
+        #Invoices are kept locally, and updated with SubscribeInvoices:
+        self.invoiceLock = threading.Lock()
+        self.invoices = None #dict payment_request->Invoice, or None if not loaded
+        self.staleInvoices = None #the last loaded invoices, after a failure
+        threading.Thread(target=self.subscribeInvoices, daemon=True).start()
+        threading.Thread(target=self.watchInvoiceExpirations, daemon=True).start()
+
+        #Node aliases and colors rarely change, so they are cached:
+        self.nodeInfoCache = TTLCache(
+            float(self.config.getValue('core', 'nodeinfottl')),
+            int(self.config.getValue('core', 'nodeinfocachesize'))
+            )
+        threading.Thread(target=self.subscribeChannelGraph, daemon=True).start()
+
 
     @staticmethod
     def getMissingFields(cls):
@@ -195,6 +250,7 @@ class Backend(Backend_Base):
                 self.creds)
 
             self.rpc = lnrpc.LightningStub(self.channel)
+            self.rawMethods = {}
 
             try:
                 self.updateNativeCurrencyCache()
@@ -214,6 +270,18 @@ class Backend(Backend_Base):
             self.connectInProgress = False
 
 
+    def prefetch(self, methods=None):
+        '''
+        Arguments:
+            methods: None or iterable of str
+                Names of the getter methods that will be called
+        Returns: None
+        Exceptions:
+            none
+        '''
+        pass #not (yet) supported by this back-end
+
+
     def getBackendName(self):
         '''
         Arguments:
@@ -266,6 +334,135 @@ class Backend(Backend_Base):
     @manageConnection
     @translateRPCExceptions
     def runCommandLowLevel(self, cmd, **kwargs):
+        method, request, metadata = self.makeRequest(cmd, **kwargs)
+        fingerprinted = cmd in self.fingerprintedCommands
+        if fingerprinted:
+            method = self.getRawMethod(cmd, request)
+
+        try:
+            logging.debug('> LND RPC %s %s' % (cmd, str(kwargs)))
+            response = method(request, **metadata)
+            if fingerprinted:
+                response = self.decodeFingerprinted(cmd, request, response)
+            logging.debug('< LND RPC %s = %s' % (cmd, str(response)))
+        except Exception as e:
+            logging.debug('< LND RPC %s: %s' % (cmd, str(e)))
+            raise
+
+        return response
+
+
+    @manageConnection
+    def runCommandAsync(self, cmd, **kwargs):
+        '''
+        Starts a unary command without waiting for its response.
+        Arguments:
+            cmd: str
+            **kwargs: request fields
+        Returns: grpc.Future or FingerprintedFuture
+            To be passed to getFutureResult.
+        Exceptions:
+            Backend.CommandFailed: the command could not be started
+            Backend.NotConnected: not connected to the backend
+        '''
+        method, request, metadata = self.makeRequest(cmd, **kwargs)
+        logging.debug('> LND RPC %s %s (async)' % (cmd, str(kwargs)))
+        if cmd in self.fingerprintedCommands:
+            future = self.getRawMethod(cmd, request).future(request, **metadata)
+            return FingerprintedFuture(self, cmd, request, future)
+        return method.future(request, **metadata)
+
+
+    def getRawMethod(self, cmd, request):
+        #Like the stub's method, but without decoding the response
+        try:
+            return self.rawMethods[cmd]
+        except KeyError:
+            pass
+        channel = self.channel
+        if channel is None:
+            #Connection was lost (or is being set up) in another thread
+            raise Backend.NotConnected('Back-end is not connected')
+        method = channel.unary_unary(
+            '/lnrpc.Lightning/' + cmd,
+            request_serializer=type(request).SerializeToString,
+            response_deserializer=None
+            )
+        self.rawMethods[cmd] = method
+        return method
+
+
+    def decodeFingerprinted(self, cmd, request, rawResponse):
+        '''
+        Arguments:
+            cmd: str
+            request: the request message
+            rawResponse: bytes
+                The serialized response
+        Returns:
+            The decoded response. If the response is identical to the
+            previous response to the same request, the previously decoded
+            response is returned; therefore, it must not be modified.
+        '''
+        key = (cmd, request.SerializeToString(deterministic=True))
+        fingerprint = hashlib.sha256(rawResponse).digest()
+        last = self.lastResponses.get(key)
+        if last is not None and last[0] == fingerprint:
+            return last[1]
+
+        outputType = ln.DESCRIPTOR.services_by_name['Lightning'] \
+            .methods_by_name[cmd].output_type
+        response = getattr(ln, outputType.name).FromString(rawResponse)
+        self.lastResponses[key] = (fingerprint, response)
+        return response
+
+
+    def convertResult(self, name, convert, responses, *args):
+        '''
+        Arguments:
+            name: str
+            convert: function
+            responses: tuple
+                The decoded responses
+            *args: additional arguments of convert
+        Returns:
+            convert(*responses, *args). If all responses are the same
+            objects as the previous time (because they were unchanged, see
+            decodeFingerprinted), and args are equal, the previous return
+            value is returned instead.
+        '''
+        previous = self.convertedResults.get(name)
+        if previous is not None and previous[1] == args and \
+                len(previous[0]) == len(responses) and \
+                all(a is b for a, b in zip(previous[0], responses)):
+            return previous[2]
+        converted = convert(*responses, *args)
+        self.convertedResults[name] = (responses, args, converted)
+        return converted
+
+
+    @translateRPCExceptions
+    def getFutureResult(self, future):
+        '''
+        Arguments:
+            future: grpc.Future
+                as returned by runCommandAsync
+        Returns:
+            The response
+        Exceptions:
+            Backend.CommandFailed: the command failed
+            Backend.NotConnected: not connected to the backend
+        '''
+        try:
+            response = future.result()
+            logging.debug('< LND RPC (async) = %s' % str(response))
+        except Exception as e:
+            logging.debug('< LND RPC (async): %s' % str(e))
+            raise
+        return response
+
+
+    def makeRequest(self, cmd, **kwargs):
         try:
             method = getattr(self.rpc, cmd)
             try:
@@ -277,6 +474,8 @@ class Backend(Backend_Base):
                 'ListInvoices': 'ListInvoiceRequest',
                 'AddInvoice': 'Invoice',
                 'DecodePayReq': 'PayReqString',
+                'SubscribeInvoices': 'InvoiceSubscription',
+                'SubscribeChannelGraph': 'GraphTopologySubscription',
                 }[cmd]
             except KeyError:
                 requestTypeName = cmd + 'Request'
@@ -289,19 +488,12 @@ class Backend(Backend_Base):
         except ValueError as e:
             raise Backend.CommandFailed('Could not run the command: ' + str(e))
 
-        try:
-            logging.debug('> LND RPC %s %s' % (cmd, str(kwargs)))
-            if self.macaroon is None:
-                response = method(request)
-            else:
-                response = method(request, metadata=[('macaroon', self.macaroon)])
-
-            logging.debug('< LND RPC %s = %s' % (cmd, str(response)))
-        except Exception as e:
-            logging.debug('< LND RPC %s: %s' % (cmd, str(e)))
-            raise
+        if self.macaroon is None:
+            metadata = {}
+        else:
+            metadata = {'metadata': [('macaroon', self.macaroon)]}
 
-        return response
+        return method, request, metadata
 
 
     def updateNativeCurrencyCache(self):
@@ -352,10 +544,13 @@ class Backend(Backend_Base):
         Exceptions:
             Backend.NotConnected: not connected to the backend
         '''
+        return self.convertResult('nonChannelFunds', self.makeNonChannelFunds,
+            (self.runCommandLowLevel('WalletBalance'),))
+
 
+    def makeNonChannelFunds(self, balance):
         #For now, we can not determine individual on-chain transactions.
         #Construct some fake transactions based on the reported totals:
-        balance = self.runCommandLowLevel('WalletBalance')
         confirmed = balance.confirmed_balance
         unconfirmed = balance.total_balance - balance.confirmed_balance
         return \
@@ -373,10 +568,43 @@ class Backend(Backend_Base):
         Exceptions:
             Backend.NotConnected: not connected to the backend
         '''
+        return self.convertResult('channelFunds', self.makeChannelFunds,
+            (
+            self.runCommandLowLevel('PendingChannels'),
+            self.runCommandLowLevel('ListChannels')
+            ))
 
+
+    def getFunds(self):
+        '''
+        Arguments:
+        Returns: tuple(dict, list(Channel))
+            The non-channel funds and the channel funds, in the formats of
+            getNonChannelFunds and getChannelFunds.
+        Exceptions:
+            Backend.NotConnected: not connected to the backend
+        '''
+        #Issue all requests at once:
+        balance, pendingChannels, openChannels = \
+        [
+        self.runCommandAsync(cmd)
+        for cmd in ['WalletBalance', 'PendingChannels', 'ListChannels']
+        ]
+        return \
+        (
+        self.convertResult('nonChannelFunds', self.makeNonChannelFunds,
+            (self.getFutureResult(balance),)),
+        self.convertResult('channelFunds', self.makeChannelFunds,
+            (
+            self.getFutureResult(pendingChannels),
+            self.getFutureResult(openChannels)
+            ))
+        )
+
+
+    def makeChannelFunds(self, pendingChannels, openChannels):
         ret = []
 
-        pendingChannels = self.runCommandLowLevel('PendingChannels')
         for (cList, state) in \
             [
             (pendingChannels.pending_open_channels, 'opening'),
@@ -399,9 +627,7 @@ class Backend(Backend_Base):
                     peerFunds      = 1000 * chn.remote_balance,
                     ))
 
-        openChannels = self.runCommandLowLevel('ListChannels')
-        openChannels = openChannels.channels
-        for chn in openChannels:
+        for chn in openChannels.channels:
             txID, index = chn.channel_point.split(':')
             ret.append(Backend.Channel(
                 channelID      = Backend.ChannelID(
@@ -427,10 +653,43 @@ class Backend(Backend_Base):
         Exceptions:
             Backend.NotConnected: not connected to the backend
         '''
-        peerDict = {}
+        channelDict, connected = self.convertResult(
+            'peerChannels', self.makePeerChannels,
+            (
+            self.runCommandLowLevel('PendingChannels'),
+            self.runCommandLowLevel('ListChannels'),
+            self.runCommandLowLevel('ListPeers')
+            ))
+
+        #Alias and color come from the node info cache. Missing ones are
+        #requested all at once, so we only have to wait for the slowest
+        #one instead of for all of them in sequence.
+        nodeInfo = {peerID: self.nodeInfoCache.get(peerID) for peerID in channelDict}
+        missing = [peerID for peerID, info in nodeInfo.items() if info is None]
+        nodeInfoFutures = \
+        [
+        self.runCommandAsync('GetNodeInfo', pub_key=peerID)
+        for peerID in missing
+        ]
+        for peerID, future in zip(missing, nodeInfoFutures):
+            try:
+                node = self.getFutureResult(future).node
+                info = (node.alias, node.color[1:]) #remove '#'
+            except Backend.CommandFailed:
+                info = ('unknown', '888888')
+            #Also cached if unknown: a graph update will invalidate it
+            self.nodeInfoCache.set(peerID, info)
+            nodeInfo[peerID] = info
+
+        return self.convertResult('peers', self.makePeers,
+            (channelDict, connected), nodeInfo)
+
+
+    def makePeerChannels(self, pendingChannels, openChannels, peers):
+        #Returns: dict(peerID -> list(Channel)), set(peerID of connected peers)
+        channelDict = {} #peerID -> list(Channel)
 
         #Pending channels
-        pendingChannels = self.runCommandLowLevel('PendingChannels')
         for (cList, state) in \
             [
             (pendingChannels.pending_open_channels, 'opening'),
@@ -453,20 +712,11 @@ class Backend(Backend_Base):
                     lockedOutgoing = 0, #TODO
                     peerFunds      = 1000 * chn.remote_balance,
                     )
-                if peerID in peerDict:
-                    peerDict[peerID].channels.append(channel)
-                else:
-                    peerDict[peerID] = Backend.Peer(
-                        peerID = peerID,
-                        connected = False, #to be overwritten later if True
-                        channels = [channel]
-                        )
+                channelDict.setdefault(peerID, []).append(channel)
 
 
         #Open channels
-        openChannels = self.runCommandLowLevel('ListChannels')
-        openChannels = openChannels.channels
-        for chn in openChannels:
+        for chn in openChannels.channels:
             peerID = chn.remote_pubkey
             txID, index = chn.channel_point.split(':')
             channel = Backend.Channel(
@@ -481,39 +731,28 @@ class Backend(Backend_Base):
                 lockedOutgoing = 0, #TODO
                 peerFunds      = 1000 * chn.remote_balance,
                 )
-            if peerID in peerDict:
-                peerDict[peerID].channels.append(channel)
-            else:
-                peerDict[peerID] = Backend.Peer(
-                    peerID = peerID,
-                    connected = False, #to be overwritten later if True
-                    channels = [channel]
-                    )
+            channelDict.setdefault(peerID, []).append(channel)
 
-        peers = self.runCommandLowLevel('ListPeers')
+        connected = set()
         for p in peers.peers:
-            peerID = p.pub_key
-            if peerID in peerDict:
-                #Connected peers have channels
-                peerDict[peerID].connected = True
-            else:
-                #Connected peers that don't have any channels
-                peerDict[peerID] = Backend.Peer(
-                    peerID = peerID,
-                    connected = True,
-                    channels = []
-                    )
+            connected.add(p.pub_key)
+            #Connected peers that don't have any channels get an empty list
+            channelDict.setdefault(p.pub_key, [])
 
-        ret = list(peerDict.values())
-        for peer in ret:
-            try:
-                nodeInfo = self.runCommandLowLevel('GetNodeInfo', pub_key=peer.peerID)
-                nodeInfo = nodeInfo.node
-                peer.alias = nodeInfo.alias
-                peer.color = nodeInfo.color[1:] #remove '#'
-            except Backend.CommandFailed:
-                peer.alias = 'unknown'
-                peer.color = '888888'
+        return channelDict, connected
+
+
+    def makePeers(self, channelDict, connected, nodeInfo):
+        ret = []
+        for peerID, channels in channelDict.items():
+            alias, color = nodeInfo[peerID]
+            ret.append(Backend.Peer(
+                peerID = peerID,
+                alias = alias,
+                color = color,
+                connected = peerID in connected,
+                channels = tuple(channels)
+                ))
         return ret
 
 
@@ -525,38 +764,159 @@ class Backend(Backend_Base):
         Exceptions:
             Backend.NotConnected: not connected to the backend
         '''
+        with self.invoiceLock:
+            if self.invoices is not None:
+                return list(self.invoices.values())
+
+        #Not subscribed (yet): load them ourselves.
+        return self.loadInvoices()
+
+
+    def loadInvoices(self):
+        #Returns the loaded invoices.
+        #If invoices were loaded before, the differences are pushed to the
+        #front-end, since updates may have been missed in between.
         invoices = self.runCommandLowLevel('ListInvoices')
-        ret = []
+        if self.nativeCurrency is None:
+            #Another thread is still connecting
+            raise Backend.NotConnected('Back-end is not connected')
+        invoices = [self.makeInvoice(inv) for inv in invoices.invoices]
+        newInvoices = {inv.bolt11: inv for inv in invoices}
+        with self.invoiceLock:
+            oldInvoices = self.invoices
+            if oldInvoices is None:
+                oldInvoices = self.staleInvoices
+            self.invoices = newInvoices
+            self.staleInvoices = None
+
+        if oldInvoices is not None:
+            for bolt11, inv in newInvoices.items():
+                if oldInvoices.get(bolt11) != inv:
+                    self.frontend.invoiceChanged(inv)
+            for bolt11, inv in oldInvoices.items():
+                if bolt11 not in newInvoices:
+                    self.frontend.invoiceRemoved(inv)
+        return invoices
+
+
+    def makeInvoice(self, inv):
+        expirationTime = inv.creation_date + inv.expiry
+        if inv.settled:
+            status = 'paid'
+        elif expirationTime < time.time():
+            status = 'expired'
+        else:
+            status = 'pending'
+
+        #Everything we need is in the invoice itself, so the payment
+        #request doesn't need to be decoded.
+        data = Backend.InvoiceData(
+            creationTime = inv.creation_date,
+            expirationTime = expirationTime,
+            min_final_cltv_expiry = inv.cltv_expiry,
+            amount = inv.value * 1000,
+            currency = self.nativeCurrency, #checked by loadInvoices
+            description = inv.memo,
+            paymentHash = binascii.hexlify(inv.r_hash).decode()
+            )
 
-        for inv in invoices.invoices:
-            expirationTime = inv.creation_date + inv.expiry
-            if inv.settled:
-                status = 'paid'
-            elif expirationTime < time.time():
-                status = 'expired'
-            else:
-                status = 'pending'
+        return Backend.Invoice(
+            status = status,
+            bolt11 = inv.payment_request,
+            data = data
+            )
 
-            try:
-                data = self.decodeInvoiceData(inv.payment_request)
-            except Backend.CommandFailed:
-                data = Backend.InvoiceData(
-                    creationTime = inv.creation_date,
-                    expirationTime = expirationTime,
-                    min_final_cltv_expiry = inv.cltv_expiry,
-                    amount = inv.value * 1000,
-                    currency = self.getNativeCurrency(),
-                    description = inv.memo,
-                    paymentHash = inv.r_hash
-                    )
 
-            ret.append(Backend.Invoice(
-                status = status,
-                bolt11 = inv.payment_request,
-                data = data
-                ))
+    def setInvoice(self, invoice):
+        with self.invoiceLock:
+            if self.invoices is None:
+                return #will be loaded in full later
+            self.invoices[invoice.bolt11] = invoice
+        self.frontend.invoiceChanged(invoice)
+
+
+    def subscribeInvoices(self):
+        #Runs in a background thread.
+        while True:
+            #Connecting is left to the refresh worker, since it may ask for
+            #the wallet passphrase. While connecting for the first time, the
+            #native currency may not be known yet.
+            if self.rpc is not None and self.nativeCurrency is not None:
+                try:
+                    #Subscribe before loading, so no update can get lost
+                    #in between:
+                    stream = self.runCommandLowLevel('SubscribeInvoices')
+                    self.loadInvoices()
+                    for inv in stream:
+                        self.setInvoice(self.makeInvoice(inv))
+                except Exception as e:
+                    logging.debug('Invoice subscription failed: %s' % str(e))
+
+                with self.invoiceLock:
+                    #Reloaded when subscribing again; the differences are
+                    #pushed then.
+                    if self.invoices is not None:
+                        self.staleInvoices = self.invoices
+                    self.invoices = None
+
+            time.sleep(1)
+
+
+    def subscribeChannelGraph(self):
+        #Runs in a background thread.
+        while True:
+            if self.rpc is not None:
+                try:
+                    stream = self.runCommandLowLevel('SubscribeChannelGraph')
+                    #Node updates may have been missed while not subscribed:
+                    self.nodeInfoCache.clear()
+                    for update in stream:
+                        for node in update.node_updates:
+                            self.nodeInfoCache.invalidate(node.identity_key)
+                except Exception as e:
+                    logging.debug('Channel graph subscription failed: %s' % str(e))
+
+            time.sleep(1)
+
+
+    def watchInvoiceExpirations(self):
+        #Runs in a background thread.
+        while True:
+            now = time.time()
+            with self.invoiceLock:
+                invoices = [] if self.invoices is None else list(self.invoices.values())
+            expirationTimes = \
+            [
+            inv.data.expirationTime for inv in invoices
+            if inv.status == 'pending'
+            ]
 
-        return ret
+            for inv in invoices:
+                if inv.status == 'pending' and inv.data.expirationTime <= now:
+                    self.setInvoice(Backend.Invoice(
+                        status = 'expired',
+                        bolt11 = inv.bolt11,
+                        data = inv.data
+                        ))
+
+            timeout = self.invoiceExpirationCheckInterval
+            futureTimes = [t for t in expirationTimes if t > now]
+            if futureTimes:
+                timeout = min(timeout, min(futureTimes) - now)
+            time.sleep(max(1, timeout))
+
+
+    @staticmethod
+    def pushesInvoiceUpdates():
+        '''
+        Arguments:
+        Returns: bool
+            True if this back-end calls the front-end's invoiceChanged method
+            for every new or changed invoice, and its invoiceRemoved method
+            for every removed invoice, so the invoice list only needs to be
+            retrieved once (and again after a connection loss).
+        '''
+        return True
 
 
     def getPayments(self):
@@ -602,18 +962,11 @@ class Backend(Backend_Base):
             Backend.CommandFailed: the command failed (e.g. invalid bolt11 code)
             Backend.NotConnected: not connected to the backend
         '''
-        response = self.runCommandLowLevel('DecodePayReq',
-            pay_req = bolt11
-            )
-        return Backend.InvoiceData(
-            creationTime = response.timestamp,
-            expirationTime = response.timestamp + response.expiry,
-            min_final_cltv_expiry = response.cltv_expiry,
-            amount = response.num_satoshis * 1000,
-            currency = self.getNativeCurrency(), #TODO: this is wrong
-            description = response.description,
-            paymentHash = response.payment_hash,
-            )
+        #Decoded locally: no need for a DecodePayReq round-trip
+        try:
+            return bolt11decoder.decode(bolt11)
+        except ValueError as e:
+            raise Backend.CommandFailed(str(e))
 
 
     def pay(self, bolt11):
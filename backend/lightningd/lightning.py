@@ -1,9 +1,14 @@
+from concurrent.futures import Future
 from decimal import Decimal
 from math import floor, log10
+import asyncio
+import hashlib
 import json
 import logging
 import os
+import re
 import socket
+import threading
 import warnings
 
 
@@ -24,31 +29,48 @@ class Millisatoshi:
     Many JSON API fields are expressed in millisatoshis: these automatically get
     turned into Millisatoshi types. Converts to and from int.
     """
+    __slots__ = ('millisatoshis',)
+
     def __init__(self, v):
         """
         Takes either a string ending in 'msat', 'sat', 'btc' or an integer.
         """
-        if isinstance(v, str):
+        if type(v) is int:
+            millisatoshis = v
+        elif isinstance(v, str):
             if v.endswith("msat"):
-                self.millisatoshis = int(v[0:-4])
-            elif v.endswith("sat"):
-                self.millisatoshis = Decimal(v[0:-3]) * 1000
-            elif v.endswith("btc"):
-                self.millisatoshis = Decimal(v[0:-3]) * 1000 * 10**8
+                millisatoshis = int(v[0:-4])
             else:
-                raise TypeError("Millisatoshi must be string with msat/sat/btc suffix or int")
-            if self.millisatoshis != int(self.millisatoshis):
-                raise ValueError("Millisatoshi must be a whole number")
-            self.millisatoshis = int(self.millisatoshis)
+                if v.endswith("sat"):
+                    millisatoshis = Decimal(v[0:-3]) * 1000
+                elif v.endswith("btc"):
+                    millisatoshis = Decimal(v[0:-3]) * 1000 * 10**8
+                else:
+                    raise TypeError("Millisatoshi must be string with msat/sat/btc suffix or int")
+                if millisatoshis != int(millisatoshis):
+                    raise ValueError("Millisatoshi must be a whole number")
+                millisatoshis = int(millisatoshis)
         elif isinstance(v, Millisatoshi):
-            self.millisatoshis = v.millisatoshis
+            millisatoshis = v.millisatoshis
         elif int(v) == v:
-            self.millisatoshis = int(v)
+            millisatoshis = int(v)
         else:
             raise TypeError("Millisatoshi must be string with msat/sat/btc suffix or int")
 
-        if self.millisatoshis < 0:
+        if millisatoshis < 0:
+            raise ValueError("Millisatoshi must be >= 0")
+        self.millisatoshis = millisatoshis
+
+    @classmethod
+    def _from_int(cls, v):
+        """
+        Takes an int; skips the parsing done by the constructor.
+        """
+        if v < 0:
             raise ValueError("Millisatoshi must be >= 0")
+        ret = object.__new__(cls)
+        ret.millisatoshis = v
+        return ret
 
     def __repr__(self):
         """
@@ -139,25 +161,25 @@ class Millisatoshi:
         return self.millisatoshis >= other.millisatoshis
 
     def __add__(self, other):
-        return Millisatoshi(int(self) + int(other))
+        return Millisatoshi._from_int(self.millisatoshis + int(other))
 
     def __sub__(self, other):
-        return Millisatoshi(int(self) - int(other))
+        return Millisatoshi._from_int(self.millisatoshis - int(other))
 
     def __mul__(self, other):
-        return Millisatoshi(int(int(self) * other))
+        return Millisatoshi._from_int(int(self.millisatoshis * other))
 
     def __truediv__(self, other):
-        return Millisatoshi(int(int(self) / other))
+        return Millisatoshi._from_int(int(self.millisatoshis / other))
 
     def __floordiv__(self, other):
-        return Millisatoshi(int(self) // other)
+        return Millisatoshi._from_int(int(self.millisatoshis // other))
 
     def __mod__(self, other):
-        return Millisatoshi(int(self) % other)
+        return Millisatoshi._from_int(int(self.millisatoshis % other))
 
     def __radd__(self, other):
-        return Millisatoshi(int(self) + int(other))
+        return Millisatoshi._from_int(self.millisatoshis + int(other))
 
 
 class UnixSocket(object):
@@ -206,6 +228,15 @@ class UnixSocket(object):
                 # There is no good way to recover from this.
                 raise
 
+    def shutdown(self):
+        """Shut down the connection, waking up any thread blocked in recv."""
+        sock = self.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
     def close(self):
         if self.sock is not None:
             self.sock.close()
@@ -218,43 +249,271 @@ class UnixSocket(object):
         self.sock.sendall(b)
 
     def recv(self, length):
-        if self.sock is None:
+        sock = self.sock
+        if sock is None:
             raise socket.error("not connected")
 
-        return self.sock.recv(length)
+        return sock.recv(length)
 
     def __del__(self):
         self.close()
 
 
 class UnixDomainSocketRpc(object):
-    def __init__(self, socket_path, executor=None, logger=logging, encoder_cls=json.JSONEncoder, decoder=json.JSONDecoder()):
+    # Number of bytes to receive at once:
+    recv_size = 65536
+
+    # Maximum number of (method, params) combinations whose last response
+    # is kept for reuse_results:
+    reuse_cache_size = 256
+
+    # The start of a response, up to its result or error: the id is skipped
+    # when fingerprinting the response.
+    response_prefix = re.compile(rb'\s*\{\s*"jsonrpc"\s*:\s*"2\.0"\s*,\s*"id"\s*:\s*(-?[0-9]+)\s*,')
+
+    def __init__(self, socket_path, executor=None, logger=logging, encoder_cls=json.JSONEncoder, decoder=json.JSONDecoder(), persistent=False, multiplexed=False, reuse_results=False):
         self.socket_path = socket_path
         self.encoder_cls = encoder_cls
         self.decoder = decoder
         self.executor = executor
         self.logger = logger
+        self.persistent = persistent or multiplexed
+        self.multiplexed = multiplexed
 
         self.next_id = 0
 
+        # Only used in persistent mode: the open connection and any bytes
+        # that were received after the end of the last response.
+        self.sock = None
+        self.buff = b''
+        self.lock = threading.RLock()
+
+        # Only used in multiplexed mode: id -> (request, Future) of the calls
+        # that are waiting for a response on the current connection.
+        self.pending = {}
+
+        # Only used with reuse_results: (method, params) -> (fingerprint,
+        # response) of the last response to each call.
+        self.reuse_results = reuse_results
+        self.last_responses = {}
+
     def _writeobj(self, sock, obj):
-        s = json.dumps(obj, ensure_ascii=False, cls=self.encoder_cls)
-        sock.sendall(bytearray(s, 'UTF-8'))
+        self._writeobjs(sock, [obj])
+
+    def _writeobjs(self, sock, objs):
+        sock.sendall(self._encodeobjs(objs))
+
+    def _encodeobjs(self, objs):
+        s = ''.join(json.dumps(obj, ensure_ascii=False, cls=self.encoder_cls) for obj in objs)
+        return bytearray(s, 'UTF-8')
+
+    def _readobj(self, sock, buff=b'', find_request=None):
+        """Read a JSON object, starting with buff; returns object and any buffer left over.
+
+        With reuse_results, {find_request} maps a response id to its request
+        (or None); see _decodeobj.
+        """
+        buff = bytearray(buff)
+        # Only newly received bytes are searched for the terminator, plus the
+        # last byte before them, in case the terminator is split.
+        end = buff.find(b'\n\n')
+        while end < 0:
+            # Didn't read enough.
+            b = sock.recv(self.recv_size)
+            if len(b) == 0:
+                return {'error': 'Connection to RPC server lost.'}, bytes(buff)
+            start = max(0, len(buff) - 1)
+            buff += b
+            end = buff.find(b'\n\n', start)
+
+        obj = self._decodeobj(buff[:end], find_request)
+        return obj, bytes(buff[end + 2:])
+
+    def _decodeobj(self, raw, find_request=None):
+        """Decode the raw bytes of a response.
+
+        With reuse_results, the bytes after the id are fingerprinted. If the
+        previous response to the same method and params had the same
+        fingerprint, it is not decoded again: the previously decoded object
+        is returned (with the new id), so its result is the same object as
+        before. Callers must therefore not modify results.
+        """
+        match = None
+        if self.reuse_results and find_request is not None:
+            match = self.response_prefix.match(raw)
+        if match is None:
+            obj, _ = self.decoder.raw_decode(raw.decode("UTF-8"))
+            return obj
+
+        id = int(match.group(1))
+        request = find_request(id)
+        if request is None or (self.reuse_results is not True and request['method'] not in self.reuse_results):
+            obj, _ = self.decoder.raw_decode(raw.decode("UTF-8"))
+            return obj
+
+        key = (request['method'], json.dumps(request['params'], sort_keys=True, cls=self.encoder_cls))
+        fingerprint = hashlib.sha256(memoryview(raw)[match.end():]).digest()
+        last = self.last_responses.get(key)
+        if last is not None and last[0] == fingerprint:
+            obj = dict(last[1])
+            obj['id'] = id
+            return obj
+
+        obj, _ = self.decoder.raw_decode(raw.decode("UTF-8"))
+        if isinstance(obj, dict) and 'result' in obj:
+            if len(self.last_responses) >= self.reuse_cache_size:
+                self.last_responses.clear()
+            self.last_responses[key] = (fingerprint, obj)
+        return obj
+
+    def _readresponses(self, sock, requests, buff=b''):
+        """Read the responses to requests, in whatever order they arrive.
+
+        Returns a dict of id -> response, whether the connection is still
+        usable and any buffer left over. If the connection is lost (or gets
+        out of sync), all unanswered requests get the response that ended
+        the exchange.
+        """
+        pending = set(r['id'] for r in requests)
+        requests_by_id = {r['id']: r for r in requests}
+        responses = {}
+        while pending:
+            resp, buff = self._readobj(sock, buff, requests_by_id.get)
+            if not isinstance(resp, dict) or resp.get('id') not in pending:
+                for i in pending:
+                    responses[i] = resp
+                return responses, False, buff
+            pending.remove(resp['id'])
+            responses[resp['id']] = resp
+        return responses, True, buff
+
+    def _connect(self):
+        """Return the persistent connection, opening a new one if needed."""
+        if self.sock is None:
+            self.sock = UnixSocket(self.socket_path)
+            self.buff = b''
+            if self.multiplexed:
+                self.pending = {}
+                if self.executor is None:
+                    threading.Thread(target=self._dispatch_responses, args=(self.sock, self.pending), daemon=True).start()
+                else:
+                    self.executor.submit(self._dispatch_responses, self.sock, self.pending)
+        return self.sock
+
+    def close_connection(self):
+        """Close the persistent connection; the next call will reconnect."""
+        with self.lock:
+            if self.sock is not None:
+                self.sock.shutdown()
+                self.sock.close()
+            self.sock = None
+            self.buff = b''
+            self.pending = {}
+
+    def _exchange(self, requests):
+        """Write all requests in one go and read back their responses.
+
+        Returns a dict of id -> response.
+
+        In persistent mode, if writing to a previously used connection fails,
+        lightningd has most likely closed it (e.g. because it restarted), so
+        we reconnect and try once more. Nothing is retried once the requests
+        have been written.
+        """
+        if not self.persistent:
+            sock = UnixSocket(self.socket_path)
+            try:
+                self._writeobjs(sock, requests)
+                responses, _, _ = self._readresponses(sock, requests)
+            finally:
+                sock.close()
+            return responses
+
+        reused = self.sock is not None
+        try:
+            try:
+                self._writeobjs(self._connect(), requests)
+            except OSError:
+                self.close_connection()
+                if not reused:
+                    raise
+                self._writeobjs(self._connect(), requests)
+
+            responses, usable, self.buff = self._readresponses(self.sock, requests, self.buff)
+        except BaseException:
+            # We don't know how much of the exchange took place, so the
+            # stream can not be trusted anymore.
+            self.close_connection()
+            raise
+
+        if not usable:
+            self.close_connection()
+        return responses
+
+    def _dispatch_responses(self, sock, pending):
+        """Multiplexed mode: the reader loop of one connection.
+
+        Hands every response to the future of the call with the same id. When
+        the connection is lost, all calls still waiting on it fail.
+        """
+        buff = b''
+
+        def find_request(id):
+            return pending.get(id, (None, None))[0]
 
-    def _readobj(self, sock, buff=b''):
-        """Read a JSON object, starting with buff; returns object and any buffer left over."""
         while True:
-            parts = buff.split(b'\n\n', 1)
-            if len(parts) == 1:
-                # Didn't read enough.
-                b = sock.recv(max(1024, len(buff)))
-                buff += b
-                if len(b) == 0:
-                    return {'error': 'Connection to RPC server lost.'}, buff
-            else:
-                buff = parts[1]
-                obj, _ = self.decoder.raw_decode(parts[0].decode("UTF-8"))
-                return obj, buff
+            try:
+                resp, buff = self._readobj(sock, buff, find_request)
+            except Exception as e:
+                resp = {'error': 'Connection to RPC server lost: {}'.format(e)}
+
+            with self.lock:
+                lost = not isinstance(resp, dict) or resp.get('id') not in pending
+                if lost:
+                    # Connection lost, or out of sync with the server.
+                    if self.sock is sock:
+                        self.close_connection()
+                    waiting = list(pending.values())
+                    pending.clear()
+                    if not isinstance(resp, dict) or 'error' not in resp or 'id' in resp:
+                        resp = {'error': 'Unexpected response from RPC server: {!r}'.format(resp)}
+                else:
+                    waiting = [pending.pop(resp['id'])]
+
+            for request, future in waiting:
+                self.logger.debug("Received response for %s call: %r", request['method'], resp)
+                try:
+                    future.set_result(self._get_result(request, resp))
+                except Exception as e:
+                    future.set_exception(e)
+
+            if lost:
+                return
+
+    def _submit(self, requests):
+        """Multiplexed mode: write the requests; returns their futures.
+
+        Like in _exchange, if writing to a previously used connection fails,
+        we reconnect and try once more.
+        """
+        futures = [Future() for r in requests]
+        with self.lock:
+            reused = self.sock is not None
+            while True:
+                sock = self._connect()
+                pending = self.pending
+                # Register before writing: the response may arrive right away.
+                pending.update((r['id'], (r, f)) for r, f in zip(requests, futures))
+                try:
+                    self._writeobjs(sock, requests)
+                    return futures
+                except OSError:
+                    for r in requests:
+                        pending.pop(r['id'], None)
+                    self.close_connection()
+                    if not reused:
+                        raise
+                    reused = False
 
     def __getattr__(self, name):
         """Intercept any call that is not explicitly defined and call @call.
@@ -273,28 +532,25 @@ class UnixDomainSocketRpc(object):
                 return self.call(name, payload=kwargs)
         return wrapper
 
-    def call(self, method, payload=None):
-        self.logger.debug("Calling %s with payload %r", method, payload)
-
+    def _make_request(self, method, payload):
         if payload is None:
             payload = {}
         # Filter out arguments that are None
         if isinstance(payload, dict):
             payload = {k: v for k, v in payload.items() if v is not None}
 
-        # FIXME: we open a new socket for every readobj call...
-        sock = UnixSocket(self.socket_path)
-        self._writeobj(sock, {
+        request = {
             "jsonrpc": "2.0",
             "method": method,
             "params": payload,
             "id": self.next_id,
-        })
+        }
         self.next_id += 1
-        resp, _ = self._readobj(sock)
-        sock.close()
+        return request
 
-        self.logger.debug("Received response for %s call: %r", method, resp)
+    @staticmethod
+    def _get_result(request, resp):
+        method, payload = request['method'], request['params']
         if not isinstance(resp, dict):
             raise ValueError("Malformed response, response is not a dictionary %s." % resp)
         elif "error" in resp:
@@ -303,6 +559,56 @@ class UnixDomainSocketRpc(object):
             raise ValueError("Malformed response, \"result\" missing.")
         return resp["result"]
 
+    def call_future(self, method, payload=None):
+        """Start a call; returns a Future of its result.
+
+        Only available in multiplexed mode, where any number of calls, from
+        any number of threads, can be waiting for their response.
+        """
+        if not self.multiplexed:
+            raise ValueError("call_future requires multiplexed mode")
+        self.logger.debug("Calling %s with payload %r", method, payload)
+
+        with self.lock:
+            request = self._make_request(method, payload)
+        return self._submit([request])[0]
+
+    def call(self, method, payload=None):
+        if self.multiplexed:
+            return self.call_future(method, payload).result()
+
+        self.logger.debug("Calling %s with payload %r", method, payload)
+
+        with self.lock:
+            request = self._make_request(method, payload)
+            resp = self._exchange([request])[request['id']]
+
+        self.logger.debug("Received response for %s call: %r", method, resp)
+        return self._get_result(request, resp)
+
+    def call_batch(self, calls):
+        """Perform several calls in a single round trip.
+
+        {calls} is a list of (method, payload) tuples. All requests are
+        written at once, and the responses are matched to them by id.
+        Returns the list of results, in the order of {calls}; raises for the
+        first call that failed.
+        """
+        self.logger.debug("Calling batch %r", calls)
+
+        with self.lock:
+            requests = [self._make_request(method, payload) for method, payload in calls]
+            if self.multiplexed:
+                futures = self._submit(requests)
+            else:
+                responses = self._exchange(requests)
+
+        if self.multiplexed:
+            return [f.result() for f in futures]
+
+        self.logger.debug("Received responses for batch: %r", responses)
+        return [self._get_result(r, responses[r['id']]) for r in requests]
+
 
 class LightningRpc(UnixDomainSocketRpc):
     """
@@ -315,7 +621,28 @@ class LightningRpc(UnixDomainSocketRpc):
     returns a future immediately, instead of blocking indefinitely.
 
     This implementation is thread safe in that it locks the socket
-    between calls, but it does not (yet) support concurrent calls.
+    between calls. By default it does not support concurrent calls.
+
+    With `persistent` set to true, a single connection is kept open and
+    re-used for consecutive calls; it is re-opened automatically when
+    lightningd closes it.
+
+    With `multiplexed` set to true, the connection is shared by concurrent
+    calls: each thread writes its requests and waits for a future, and a
+    single reader hands each response to the future with the matching id.
+    The reader runs on `executor` if one is given (it occupies one of its
+    workers for as long as the connection is open), or on a daemon thread
+    otherwise.
+
+    With `plain_msat` set to true, msat fields are returned as plain ints
+    instead of Millisatoshi objects.
+
+    With `reuse_results` set to true, a response that is byte-for-byte
+    identical to the previous response to the same call is not decoded
+    again: the previous result object is returned instead. Results must
+    then be treated as read-only. Since the last response of every call is
+    kept, `reuse_results` can also be set to a collection of method names,
+    to only do this for those methods.
     """
 
     class LightningJSONEncoder(json.JSONEncoder):
@@ -327,8 +654,13 @@ class LightningRpc(UnixDomainSocketRpc):
             return json.JSONEncoder.default(self, o)
 
     class LightningJSONDecoder(json.JSONDecoder):
-        def __init__(self, *, object_hook=None, parse_float=None, parse_int=None, parse_constant=None, strict=True, object_pairs_hook=None):
+        """
+        Turns msat fields into Millisatoshi, or into plain ints if
+        {plain_msat} is set.
+        """
+        def __init__(self, *, plain_msat=False, object_hook=None, parse_float=None, parse_int=None, parse_constant=None, strict=True, object_pairs_hook=None):
             self.object_hook_next = object_hook
+            self.convert_msat = LightningRpc.LightningJSONDecoder.msat_to_int if plain_msat else Millisatoshi
             super().__init__(object_hook=self.millisatoshi_hook, parse_float=parse_float, parse_int=parse_int, parse_constant=parse_constant, strict=strict, object_pairs_hook=object_pairs_hook)
 
         @staticmethod
@@ -351,14 +683,30 @@ class LightningRpc(UnixDomainSocketRpc):
 
             return obj
 
+        @staticmethod
+        def msat_to_int(v):
+            return int(v[:-4])
+
         def millisatoshi_hook(self, obj):
-            obj = LightningRpc.LightningJSONDecoder.replace_amounts(obj)
+            """
+            Replace the _msat fields of obj. The parser calls this for the
+            innermost objects first, so nested objects are already done.
+            """
+            convert = self.convert_msat
+            for k, v in obj.items():
+                if k.endswith('msat'):
+                    if isinstance(v, str):
+                        if v.endswith('msat'):
+                            obj[k] = convert(v)
+                    # Special case for array of msat values
+                    elif isinstance(v, list) and all(isinstance(e, str) and e.endswith('msat') for e in v):
+                        obj[k] = [convert(e) for e in v]
             if self.object_hook_next:
                 obj = self.object_hook_next(obj)
             return obj
 
-    def __init__(self, socket_path, executor=None, logger=logging):
-        super().__init__(socket_path, executor, logger, self.LightningJSONEncoder, self.LightningJSONDecoder())
+    def __init__(self, socket_path, executor=None, logger=logging, persistent=False, multiplexed=False, plain_msat=False, reuse_results=False):
+        super().__init__(socket_path, executor, logger, self.LightningJSONEncoder, self.LightningJSONDecoder(plain_msat=plain_msat), persistent, multiplexed, reuse_results)
 
     def autocleaninvoice(self, cycle_seconds=None, expired_by=None):
         """
@@ -1189,3 +1537,128 @@ class LightningRpc(UnixDomainSocketRpc):
         }
         payload.update({k: v for k, v in kwargs.items()})
         return self.call("getsharedsecret", payload)
+
+
+class AsyncLightningRpc(LightningRpc):
+    """
+    asyncio version of LightningRpc.
+
+    It offers the same methods as LightningRpc, but as coroutines. All calls
+    share a single connection to `lightningd`, opened with
+    asyncio.open_unix_connection. A reader task hands each response to the
+    call with the matching id, so any number of calls can be in progress at
+    the same time. When lightningd closes the connection, the reader notices
+    it, and the next call opens a new one.
+    """
+
+    # Maximum size of a single response:
+    STREAM_LIMIT = 1 << 30
+
+    def __init__(self, socket_path, logger=logging, plain_msat=False):
+        super().__init__(socket_path, None, logger, plain_msat=plain_msat)
+        self.writer = None
+        self.connect_lock = None
+
+    async def _connect(self):
+        """Return the writer of the connection, opening a new one if needed."""
+        if self.writer is None:
+            reader, self.writer = await asyncio.open_unix_connection(self.socket_path, limit=self.STREAM_LIMIT)
+            self.pending = {}
+            asyncio.ensure_future(self._dispatch_responses(reader, self.writer, self.pending))
+        return self.writer
+
+    def close_connection(self):
+        """Close the connection; the next call will reconnect."""
+        if self.writer is not None:
+            self.writer.close()
+        self.writer = None
+        self.pending = {}
+
+    async def _readobj(self, reader):
+        """Read a JSON object, framed by an empty line."""
+        try:
+            data = await reader.readuntil(b'\n\n')
+        except (asyncio.IncompleteReadError, OSError):
+            return {'error': 'Connection to RPC server lost.'}
+        obj, _ = self.decoder.raw_decode(data.decode("UTF-8"))
+        return obj
+
+    async def _dispatch_responses(self, reader, writer, pending):
+        while True:
+            try:
+                resp = await self._readobj(reader)
+            except Exception as e:
+                # E.g. a malformed or too large response: like a lost
+                # connection, fail all calls and reconnect on the next one.
+                resp = {'error': 'Connection to RPC server lost: {}'.format(e)}
+
+            lost = not isinstance(resp, dict) or resp.get('id') not in pending
+            if lost:
+                # Connection lost, or out of sync with the server.
+                if self.writer is writer:
+                    self.close_connection()
+                waiting = list(pending.values())
+                pending.clear()
+                if not isinstance(resp, dict) or 'error' not in resp or 'id' in resp:
+                    resp = {'error': 'Unexpected response from RPC server: {!r}'.format(resp)}
+            else:
+                waiting = [pending.pop(resp['id'])]
+
+            for request, future in waiting:
+                self.logger.debug("Received response for %s call: %r", request['method'], resp)
+                if future.done():
+                    continue  # Cancelled by the caller
+                try:
+                    future.set_result(self._get_result(request, resp))
+                except Exception as e:
+                    future.set_exception(e)
+
+            if lost:
+                return
+
+    async def _submit(self, requests):
+        """Write the requests; returns their futures."""
+        loop = asyncio.get_event_loop()
+        futures = [loop.create_future() for r in requests]
+
+        if self.connect_lock is None:
+            self.connect_lock = asyncio.Lock()
+        async with self.connect_lock:
+            writer = await self._connect()
+            pending = self.pending
+            pending.update((r['id'], (r, f)) for r, f in zip(requests, futures))
+            try:
+                writer.write(self._encodeobjs(requests))
+                await writer.drain()
+            except OSError:
+                for r in requests:
+                    pending.pop(r['id'], None)
+                self.close_connection()
+                raise
+
+        return futures
+
+    def call_future(self, method, payload=None):
+        return asyncio.ensure_future(self.call(method, payload))
+
+    async def call(self, method, payload=None):
+        self.logger.debug("Calling %s with payload %r", method, payload)
+
+        request = self._make_request(method, payload)
+        futures = await self._submit([request])
+        return await futures[0]
+
+    async def call_batch(self, calls):
+        self.logger.debug("Calling batch %r", calls)
+
+        requests = [self._make_request(method, payload) for method, payload in calls]
+        futures = await self._submit(requests)
+        return [await f for f in futures]
+
+    async def getpeer(self, peer_id, level=None):
+        payload = {
+            "id": peer_id,
+            "level": level
+        }
+        res = await self.call("listpeers", payload)
+        return res.get("peers") and res["peers"][0] or None
@@ -0,0 +1,160 @@
+#    Copyright (C) 2018 by Bitonic B.V.
+#
+#    This file is part of Fireworks.
+#
+#    Fireworks is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Fireworks is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Fireworks. If not, see <http://www.gnu.org/licenses/>.
+
+from concurrent.futures import Future
+import functools
+import threading
+
+
+
+class SnapshotCache:
+    '''
+    Wraps a back-end, and can be used in its place.
+
+    Within one refresh generation, the results of getter methods are
+    shared: identical calls are done only once, also if they happen
+    concurrently, and all callers get the same result (or exception).
+    A new generation is started with newGeneration; mutating methods
+    invalidate all results of the current generation.
+
+    Calls from the non-waiting thread (see setNonWaitingThread) never wait
+    for a call that is in progress in another thread.
+    '''
+
+    #Methods whose results are shared within a generation:
+    cachedMethods = \
+    {
+    'getBackendName',
+    'isConnected',
+    'getNativeCurrency',
+    'getNodeLinks',
+    'getNonChannelFunds',
+    'getChannelFunds',
+    'getFunds',
+    'getPeers',
+    'getInvoices',
+    'getPayments',
+    }
+
+    #Methods that change the state of the back-end:
+    mutatingMethods = \
+    {
+    'runCommand',
+    'makeNewInvoice',
+    'pay',
+    'connect',
+    'makeChannel',
+    'closeChannel',
+    }
+
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.lock = threading.Lock()
+        self.results = {} #(method, args) -> Future
+        self.nonWaitingThread = None
+
+
+    def __getattr__(self, name):
+        #Only called for attributes not defined here
+        attr = getattr(self.backend, name)
+        if name in self.cachedMethods:
+            return functools.partial(self.callCached, name)
+        if name in self.mutatingMethods:
+            return functools.partial(self.callMutating, name)
+        return attr
+
+
+    def setNonWaitingThread(self, thread):
+        '''
+        Arguments:
+            thread: threading.Thread
+                Calls from this thread use finished results, but otherwise
+                call the back-end directly, instead of waiting for another
+                thread. This is needed for a GUI thread, when back-end
+                calls in other threads may wait for the GUI thread
+                (e.g. to ask for a password).
+        Returns: None
+        '''
+        self.nonWaitingThread = thread
+
+
+    def newGeneration(self, methods=None):
+        '''
+        Forget all results, and let the back-end prefetch the data
+        for the new generation.
+        Arguments:
+            methods: None or set(str)
+                See the back-end's prefetch method.
+        Returns: None
+        '''
+        self.invalidate()
+        self.backend.prefetch(methods)
+
+
+    def invalidate(self, method=None):
+        '''
+        Arguments:
+            method: None or str
+                If given, only forget the results of this method;
+                otherwise, forget all results.
+        Returns: None
+        '''
+        with self.lock:
+            if method is None:
+                self.results = {}
+            else:
+                self.results = \
+                {
+                k:v for k,v in self.results.items()
+                if k[0] != method
+                }
+
+
+    def callCached(self, method, *args, **kwargs):
+        key = (method, args, tuple(sorted(kwargs.items())))
+        with self.lock:
+            future = self.results.get(key)
+            mayWait = threading.current_thread() is not self.nonWaitingThread
+            if not mayWait and (future is None or not future.done()):
+                future = None
+                isOwner = False
+            else:
+                isOwner = future is None
+                if isOwner:
+                    future = Future()
+                    self.results[key] = future
+
+        if future is None:
+            return getattr(self.backend, method)(*args, **kwargs)
+
+        #The first caller does the call; the others wait for it:
+        if isOwner:
+            try:
+                future.set_result(getattr(self.backend, method)(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+
+        return future.result()
+
+
+    def callMutating(self, method, *args, **kwargs):
+        try:
+            return getattr(self.backend, method)(*args, **kwargs)
+        finally:
+            self.invalidate()
+
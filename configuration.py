@@ -62,7 +62,9 @@ class Configuration:
             },
         'core':
             {
-            'loglevel': 'info'
+            'loglevel': 'info',
+            'nodeinfottl': '3600',
+            'nodeinfocachesize': '10000',
             },
         }
 
@@ -17,7 +17,11 @@
 
 import sys
 import logging
+import threading
 from PyQt5.QtWidgets import QApplication, QDialog, QDialogButtonBox, QVBoxLayout, QLabel, QLineEdit, QMessageBox
+from PyQt5.QtCore import QObject, QThread, Qt, pyqtSignal
+
+from backend.snapshotcache import SnapshotCache
 
 from .qt.mainwindow import MainWindow
 from .qt import updatesignal
@@ -52,27 +56,71 @@ class QuestionDialog(QDialog):
 
 
 
+class GUIThreadCaller(QObject):
+    '''
+    Calls functions in the GUI thread. When used from another thread, that
+    thread waits until the function is finished.
+    '''
+    signal = pyqtSignal(object)
+
+
+    def __init__(self):
+        super().__init__()
+        self.signal.connect(self.run, Qt.BlockingQueuedConnection)
+
+
+    def run(self, job):
+        job()
+
+
+    def call(self, function, *args):
+        if QThread.currentThread() == self.thread():
+            return function(*args)
+
+        ret = {}
+        def job():
+            try:
+                ret['result'] = function(*args)
+            except Exception as e:
+                ret['exception'] = e
+        self.signal.emit(job)
+
+        if 'exception' in ret:
+            raise ret['exception']
+        return ret['result']
+
+
+
 class Frontend:
     def __init__(self, config):
         logging.info('Using Qt front-end')
         self.config = config
         self.ex = None
+        self.guiThreadCaller = None
 
 
     def setBackend(self, backend):
-        self.backend = backend
+        #All widgets share the back-end results of an update:
+        self.backend = SnapshotCache(backend)
 
 
     def run(self):
         logging.info('Starting Qt front-end')
 
         app = QApplication(sys.argv)
+        self.guiThreadCaller = GUIThreadCaller()
+
+        #The refresh worker may wait for the GUI thread (see getPassword),
+        #so the GUI thread must never wait for the refresh worker:
+        self.backend.setNonWaitingThread(threading.current_thread())
 
         self.backend.startup()
 
+        #Runs in the refresh worker thread, before any widget's fetch:
+        updatesignal.connectRefreshStart(self.backend.newGeneration)
+
         self.ex = MainWindow(self.config, self.backend)
         updatesignal.initTimer()
-        updatesignal.setUpdateInterval(1000)
 
         updatesignal.update() #First update
         sys.exit(app.exec_())
@@ -84,7 +132,11 @@ class Frontend:
             question: str
         Returns: bytes
         '''
+        #Back-ends may ask this from the refresh worker thread:
+        return self.guiThreadCaller.call(self.askPassword, question)
 
+
+    def askPassword(self, question):
         dialog = QuestionDialog(self.ex, question, isPassword=True)
         if(dialog.exec() != dialog.Accepted):
             return None
@@ -97,8 +149,36 @@ class Frontend:
         Arguments:
             message: str
         '''
+        self.guiThreadCaller.call(self.showErrorMessage, message)
+
+
+    def showErrorMessage(self, message):
         QMessageBox.critical(self.ex, 'Error', message)
 
 
+    def invoiceChanged(self, invoice):
+        '''
+        Called by back-ends that push invoice updates; may be called from
+        any thread.
+        Arguments:
+            invoice: Invoice
+                The new or changed invoice
+        '''
+        self.backend.invalidate('getInvoices')
+        updatesignal.invoiceChanged(invoice)
+
+
+    def invoiceRemoved(self, invoice):
+        '''
+        Called by back-ends that push invoice updates; may be called from
+        any thread.
+        Arguments:
+            invoice: Invoice
+                The removed invoice
+        '''
+        self.backend.invalidate('getInvoices')
+        updatesignal.invoiceRemoved(invoice)
+
+
 
 logging.info('Loaded Qt front-end module')
@@ -15,186 +15,304 @@
 #    You should have received a copy of the GNU General Public License
 #    along with Fireworks. If not, see <http://www.gnu.org/licenses/>.
 
-from PyQt5.QtWidgets import QWidget, QGridLayout, QLabel, QScrollArea, QSizePolicy, QFrame, QPushButton, QMessageBox
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QListView, QSizePolicy, QPushButton, QMessageBox, QStyledItemDelegate, QStyle
 from PyQt5 import QtGui
-from PyQt5.QtCore import Qt, QEvent
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QSize, QRect, QRectF
 
 from . import updatesignal
-from .widgets import HLine
 from .newconnectiondialog import NewConnectionDialog
 from .newchanneldialog import NewChannelDialog
 
 
 
-class BalanceBar(QWidget):
+class ChannelRow:
+    '''
+    A row in the channel list: a channel, or a peer without channels.
+    '''
+    def __init__(self, peer, channel):
+        self.peer = peer
+        self.channel = channel #None for a peer without channels
+        self.key = (peer.peerID, None if channel is None else repr(channel.channelID))
+
+        #Only these determine what is shown in the row:
+        self.contents = \
+        (
+        peer.alias, peer.color, peer.connected,
+        None if channel is None else \
+            (channel.state, channel.operational,
+            channel.ownFunds, channel.lockedIncoming,
+            channel.lockedOutgoing, channel.peerFunds)
+        )
+
+
+    def __eq__(self, obj):
+        return isinstance(obj, ChannelRow) and \
+            obj.key == self.key and obj.contents == self.contents
+
+
+    def getCapacity(self):
+        c = self.channel
+        if c is None:
+            return 0
+        return c.ownFunds + c.lockedOutgoing + c.peerFunds + c.lockedIncoming
+
+
+
+class ChannelList(QAbstractListModel):
     def __init__(self, parent):
         super().__init__(parent)
-        self.channelData = None
-        self.maxAmount = 1.0
+        self.rows = []
+        self.maxAmount = 1000 #msatoshi; Never less than this
 
 
-    def setChannelData(self, channelData):
-        self.channelData = channelData
+    def rowCount(self, parent):
+        return len(self.rows)
 
 
-    def setMaxAmount(self, maxAmount):
+    def data(self, index, role):
+        if not index.isValid():
+            return None
+        elif role == Qt.DisplayRole:
+            return self.rows[index.row()].peer.alias
+        elif role == Qt.UserRole:
+            return self.rows[index.row()]
+        return None
+
+
+    def getRow(self, index):
+        return self.rows[index]
+
+
+    def updatePeers(self, peers):
+        newRows = []
+        for peer in peers:
+            if peer.channels:
+                newRows += [ChannelRow(peer, c) for c in peer.channels]
+            else:
+                newRows.append(ChannelRow(peer, None))
+
+        #All balance bars share the same scale
+        maxAmount = max([1000] + [r.getCapacity() for r in newRows])
+        scaleChanged = maxAmount != self.maxAmount
         self.maxAmount = maxAmount
 
+        newKeys = set(r.key for r in newRows)
+        oldKeys = set(r.key for r in self.rows)
+
+        #Remove rows that are gone:
+        for i in reversed(range(len(self.rows))):
+            if self.rows[i].key not in newKeys:
+                self.beginRemoveRows(QModelIndex(), i, i)
+                del self.rows[i]
+                self.endRemoveRows()
+
+        #If the remaining rows changed order, don't bother with a diff:
+        if [r.key for r in self.rows] != [r.key for r in newRows if r.key in oldKeys]:
+            self.beginResetModel()
+            self.rows = newRows
+            self.endResetModel()
+            return
 
-    def paintEvent(self, event):
-        painter = QtGui.QPainter(self)
+        #Insert new rows, and update changed rows:
+        for i, row in enumerate(newRows):
+            if row.key not in oldKeys:
+                self.beginInsertRows(QModelIndex(), i, i)
+                self.rows.insert(i, row)
+                self.endInsertRows()
+            elif row != self.rows[i] or scaleChanged:
+                self.rows[i] = row
+                index = self.index(i)
+                self.dataChanged.emit(index, index)
 
-        palette = self.style().standardPalette()
-        if self.isEnabled():
-            palette.setCurrentColorGroup(QtGui.QPalette.Active)
-        else:
-            palette.setCurrentColorGroup(QtGui.QPalette.Disabled)
 
-        width = self.width()
-        height = self.height()
 
-        painter.setPen(palette.color(QtGui.QPalette.WindowText))
-        painter.drawRect(0,0,width-1,height-1)
+class ChannelDelegate(QStyledItemDelegate):
+    margin = 4
+    colorWidth = 8
 
-        if self.channelData is None:
+
+    def sizeHint(self, option, index):
+        height = 2 * option.fontMetrics.height() + 2 * self.margin
+        return QSize(300, height)
+
+
+    def paint(self, painter, option, index):
+        row = index.data(Qt.UserRole)
+        model = index.model()
+        painter.save()
+
+        if option.state & QStyle.State_Selected:
+            painter.fillRect(option.rect, option.palette.highlight())
+            textColor = option.palette.color(QtGui.QPalette.HighlightedText)
+        else:
+            textColor = option.palette.color(QtGui.QPalette.WindowText)
+
+        rect = option.rect.adjusted(
+            self.margin, self.margin, -self.margin, -self.margin)
+        x, y, width, height = rect.x(), rect.y(), rect.width(), rect.height()
+
+        #Peer color
+        painter.fillRect(QRect(x, y, self.colorWidth, height),
+            QtGui.QColor('#' + row.peer.color))
+        x += self.colorWidth + self.margin
+        width -= self.colorWidth + self.margin
+
+        #Peer alias and connection status
+        textWidth = width * 3 // 10
+        painter.setPen(textColor)
+        painter.drawText(QRect(x, y, textWidth, height),
+            Qt.AlignLeft | Qt.AlignVCenter,
+            '%s\n%s' % (row.peer.alias,
+                'Connected' if row.peer.connected else 'Not connected')
+            )
+        x += textWidth + self.margin
+        width -= textWidth + self.margin
+
+        if row.channel is None:
+            painter.drawText(QRect(x, y, width, height),
+                Qt.AlignLeft | Qt.AlignVCenter, '(no channels)')
+            painter.restore()
             return
-        ours      = self.channelData.ownFunds
-        lockedIn  = self.channelData.lockedIncoming
-        lockedOut = self.channelData.lockedOutgoing
-        theirs    = self.channelData.peerFunds
 
-        scaleFactor = 0.5 * (width-4) / self.maxAmount
+        #Balance bar
+        barWidth = width * 6 // 10
+        self.paintBalanceBar(painter, QRect(x, y, barWidth, height),
+            row.channel, model.maxAmount, textColor)
+        x += barWidth + self.margin
+        width -= barWidth + self.margin
+
+        #Channel state
+        if not row.channel.operational:
+            painter.setPen(option.palette.color(
+                QtGui.QPalette.Disabled, QtGui.QPalette.WindowText))
+        painter.drawText(QRect(x, y, width, height),
+            Qt.AlignLeft | Qt.AlignVCenter | Qt.TextWordWrap,
+            'State: ' + row.channel.state)
+
+        painter.restore()
+
+
+    def paintBalanceBar(self, painter, rect, channel, maxAmount, frameColor):
+        x, y, width, height = rect.x(), rect.y(), rect.width(), rect.height()
+
+        painter.setPen(frameColor)
+        painter.setBrush(Qt.NoBrush)
+        painter.drawRect(x, y, width-1, height-1)
+
+        ours      = channel.ownFunds
+        lockedIn  = channel.lockedIncoming
+        lockedOut = channel.lockedOutgoing
+        theirs    = channel.peerFunds
+
+        scaleFactor = 0.5 * (width-4) / maxAmount
         ours      *= scaleFactor
         lockedIn  *= scaleFactor
         lockedOut *= scaleFactor
         theirs    *= scaleFactor
 
-        painter.translate(width/2, 0)
+        center = x + width/2
 
         #TODO: draw lockedIn, lockedOut amounts
 
         painter.setPen(Qt.darkGreen)
         painter.setBrush(Qt.darkGreen)
-        painter.drawRect(-ours-1,1,ours,height-3)
+        painter.drawRect(QRectF(center-ours-1, y+1, ours, height-3))
 
         painter.setPen(Qt.red)
         painter.setBrush(Qt.red)
-        painter.drawRect(1,1,theirs,height-3)
+        painter.drawRect(QRectF(center+1, y+1, theirs, height-3))
 
 
 
-class ChannelsInScroll(QWidget):
+class Channels(QWidget):
     def __init__(self, parent, backend):
         super().__init__(parent)
         self.backend = backend
 
-        self.peers = None
         self.nodeLinks = None
 
-        self.layout = QGridLayout()
-        self.setLayout(self.layout)
-
-        updatesignal.connect(self.update)
+        layout = QVBoxLayout()
 
-
-    def update(self):
+        self.linksLabel = QLabel(self)
+        self.linksLabel.setTextInteractionFlags(
+            Qt.TextSelectableByMouse | \
+            Qt.TextSelectableByKeyboard
+            )
+        self.linksLabel.setSizePolicy(QSizePolicy.Preferred, QSizePolicy.Fixed)
+        layout.addWidget(self.linksLabel, 0)
+
+        self.channelList = ChannelList(self)
+        self.listView = QListView(self)
+        self.listView.setModel(self.channelList)
+        self.listView.setItemDelegate(ChannelDelegate(self.listView))
+        self.listView.setUniformItemSizes(True)
+        self.listView.setSelectionMode(QListView.SingleSelection)
+        self.listView.selectionModel().selectionChanged.connect(self.onSelectionChanged)
+        layout.addWidget(self.listView, 1)
+
+        buttonLayout = QHBoxLayout()
+        newConnectionButton = QPushButton('Connect to another node', self)
+        newConnectionButton.clicked.connect(self.onNewConnection)
+        buttonLayout.addWidget(newConnectionButton)
+        self.newChannelButton = QPushButton('New channel', self)
+        self.newChannelButton.clicked.connect(self.onNewChannel)
+        buttonLayout.addWidget(self.newChannelButton)
+        self.closeChannelButton = QPushButton('Close channel', self)
+        self.closeChannelButton.clicked.connect(self.onCloseChannel)
+        buttonLayout.addWidget(self.closeChannelButton)
+        layout.addLayout(buttonLayout, 0)
+
+        self.setLayout(layout)
+        self.onSelectionChanged()
+
+        #Expensive: many back-end calls
+        updatesignal.connectFetch(self.fetchPeers, self.showPeers,
+            self, freshness=1.0, cost=2.0,
+            methods=('getNodeLinks', 'getPeers'))
+
+
+    def fetchPeers(self):
+        #Called in the refresh worker thread
         try:
-            self.nodeLinks = self.backend.getNodeLinks()
-            newPeers = self.backend.getPeers()
-            if newPeers == self.peers:
-                return #no change - don't update
-            self.peers = newPeers
-            haveData = True
+            return \
+            (
+            tuple(self.backend.getNodeLinks()),
+            tuple(self.backend.getPeers())
+            )
         except self.backend.NotConnected:
-            self.nodeLinks = None
-            self.peers = None
-            haveData = False
+            return None
 
-        self.removeWidgets()
-        if haveData:
-            self.constructWidgets()
-        self.setEnabled(haveData)
 
+    def showPeers(self, result):
+        if result is None:
+            self.nodeLinks = None
+            self.linksLabel.setText('')
+            self.channelList.updatePeers([])
+            self.setEnabled(False)
+            return
 
-    def removeWidgets(self):
-        while True:
-            item = self.layout.takeAt(0)
-            if not item:
-                break
-            item.widget().deleteLater()
+        nodeLinks, peers = result
+        if nodeLinks != self.nodeLinks:
+            self.nodeLinks = nodeLinks
+            self.linksLabel.setText('Links to this node:\n' + '\n'.join(nodeLinks))
+        self.channelList.updatePeers(peers)
+        self.setEnabled(True)
+        self.onSelectionChanged()
 
 
-    def constructWidgets(self):
-        #Determine the scale
-        maxAmount = 1000 #msatoshi; Never less than this
-        for peer in self.peers:
-            for c in peer.channels:
-                oursTotal   = c.ownFunds + c.lockedOutgoing
-                theirsTotal = c.peerFunds + c.lockedIncoming
-                capacity = oursTotal + theirsTotal
-                maxAmount = max(maxAmount, capacity)
+    def getSelectedRow(self):
+        indexes = self.listView.selectionModel().selectedIndexes()
+        if len(indexes) != 1:
+            return None
+        return self.channelList.getRow(indexes[0].row())
 
-        #TODO: scale widget
 
-        label = QLabel('Links to this node:\n' + '\n'.join(self.nodeLinks), self)
-        label.setTextInteractionFlags(
-            Qt.TextSelectableByMouse | \
-            Qt.TextSelectableByKeyboard
-            )
-        label.setSizePolicy(QSizePolicy.Preferred, QSizePolicy.Fixed)
-        self.layout.addWidget(label, 1, 1)
-
-        newConnectionButton = QPushButton('Connect to another node', self)
-        newConnectionButton.clicked.connect(self.onNewConnection)
-        self.layout.addWidget(newConnectionButton, 2, 1)
-
-        currentRow = 3
-
-        for peer in self.peers:
-            channels = peer.channels
-            connected = 'Connected' if peer.connected else 'Not connected'
-
-            self.layout.addWidget(HLine(self), currentRow, 0, 1, 4)
-            currentRow += 1
-            label = QLabel('%s\n%s' % (peer.alias, connected), self)
-            label.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Fixed)
-            label.setEnabled(peer.connected)
-            self.layout.addWidget(label, currentRow, 0, 1+len(channels), 1)
-
-            for c in channels:
-                bar = BalanceBar(self)
-                bar.setChannelData(c)
-                bar.setMaxAmount(maxAmount)
-                bar.setEnabled(c.operational)
-                self.layout.addWidget(bar, currentRow, 1)
-
-                label = QLabel('State: ' + c.state, self)
-                label.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Fixed)
-                label.setEnabled(c.operational)
-                self.layout.addWidget(label, currentRow, 2)
-
-                def makeCloseChannelHandler(self, peer, channelID):
-                    def closeChannelHandler():
-                        return self.onCloseChannel(peer, channelID)
-                    return closeChannelHandler
-                button = QPushButton('Close', self)
-                button.clicked.connect(makeCloseChannelHandler(
-                    self, peer, c.channelID
-                    ))
-                button.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Fixed)
-                self.layout.addWidget(button, currentRow, 3)
-
-                currentRow += 1
-
-            def makeNewChannelHandler(self, peer, ):
-                def newChannelHandler():
-                    return self.onNewChannel(peer)
-                return newChannelHandler
-            button = QPushButton('New channel', self)
-            button.clicked.connect(makeNewChannelHandler(self, peer))
-            button.setEnabled(peer.connected)
-            self.layout.addWidget(button, currentRow, 1)
-            currentRow += 1
+    def onSelectionChanged(self, *args):
+        row = self.getSelectedRow()
+        self.newChannelButton.setEnabled(
+            row is not None and row.peer.connected)
+        self.closeChannelButton.setEnabled(
+            row is not None and row.channel is not None)
 
 
     def onNewConnection(self):
@@ -203,25 +321,31 @@ class ChannelsInScroll(QWidget):
             return
 
 
-    def onNewChannel(self, peer):
-        peerID = peer.peerID
-        alias = peer.alias
+    def onNewChannel(self):
+        row = self.getSelectedRow()
+        if row is None:
+            return
+        peerID = row.peer.peerID
+        alias = row.peer.alias
         try:
             dialog = NewChannelDialog(self, self.backend, peerID, alias)
         except self.backend.NotConnected:
             QMessageBox.critical(self, 'Failed to create a new channel',
                 'Creating a new channel failed: back-end not connected.'
                 )
+            return
         if(dialog.exec() != dialog.Accepted):
             return
 
 
-    def onCloseChannel(self, peer, channelID):
+    def onCloseChannel(self):
         #TODO: ask the user for confirmation
-        #alias = peer.alias
+        row = self.getSelectedRow()
+        if row is None or row.channel is None:
+            return
 
         try:
-            self.backend.closeChannel(channelID)
+            self.backend.closeChannel(row.channel.channelID)
             updatesignal.update()
         except self.backend.CommandFailed as e:
             QMessageBox.critical(self, 'Failed to close the channel',
@@ -233,28 +357,3 @@ class ChannelsInScroll(QWidget):
                 'Closing the channel failed: back-end not connected.'
                 )
 
-
-
-class Channels(QScrollArea):
-    def __init__(self, parent, backend):
-        super().__init__(parent)
-
-        inScroll = ChannelsInScroll(self, backend)
-        self.setWidget(inScroll)
-        inScroll.setSizePolicy(QSizePolicy.Preferred, QSizePolicy.Preferred)
-        inScroll.installEventFilter(self)
-
-        self.setFrameStyle(QFrame.NoFrame)
-        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
-        self.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded)
-        self.setWidgetResizable(True)
-
-
-    def eventFilter(self, obj, event):
-        if obj == self.widget() and event.type() == QEvent.Resize:
-            self.setMinimumWidth(
-                self.widget().minimumSizeHint().width()
-                )
-
-        return super().eventFilter(obj, event)
-
@@ -15,20 +15,19 @@
 #    You should have received a copy of the GNU General Public License
 #    along with Fireworks. If not, see <http://www.gnu.org/licenses/>.
 
-import copy
-
 from PyQt5.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QGridLayout, QLabel, QPushButton, QTableView, QHeaderView, QSizePolicy, QMessageBox
-from PyQt5.QtCore import Qt, QAbstractTableModel
+from PyQt5.QtCore import Qt
 
 from . import updatesignal
 from .. import formatting
 from .widgets import BigLabel, QRCode
+from .sortedtable import SortedTableModel
 from .newinvoicedialog import NewInvoiceDialog
 from .showinvoicedialog import ShowInvoiceDialog
 
 
 
-class InvoiceTable(QAbstractTableModel):
+class InvoiceTable(SortedTableModel):
     def __init__(self, parent, missingFields):
         super().__init__(parent)
 
@@ -39,11 +38,13 @@ class InvoiceTable(QAbstractTableModel):
         if self.showLabel:
             self.header = ['Label'] + self.header
 
-        self.dataList = []
+
+    def getKey(self, invoice):
+        return invoice.bolt11
 
 
-    def rowCount(self, parent):
-        return len(self.dataList)
+    def getSortKey(self, invoice):
+        return invoice.data.expirationTime
 
 
     def columnCount(self, parent):
@@ -85,16 +86,15 @@ class InvoiceTable(QAbstractTableModel):
 
 
     def updateInvoices(self, invoices):
-        oldDataList = self.dataList
+        self.updateItems(invoices)
+
+
+    def updateInvoice(self, invoice):
+        self.updateItem(invoice)
 
-        newDataList = copy.deepcopy(invoices)
-        newDataList.sort(key=lambda x: x.data.expirationTime)
-        newDataList.reverse()
 
-        if newDataList != oldDataList:
-            self.beginResetModel()
-            self.dataList = newDataList
-            self.endResetModel()
+    def removeInvoice(self, invoice):
+        self.removeItemByKey(self.getKey(invoice))
 
 
 
@@ -179,40 +179,69 @@ class Invoices(QWidget):
 
         self.setLayout(layout)
 
-        updatesignal.connect(self.update)
+        self.haveInvoices = False
 
+        updatesignal.connectFetch(self.fetchInvoices, self.showInvoices,
+            self, freshness=1.0, cost=1.0,
+            methods=('isConnected', 'getInvoices'))
+        updatesignal.connectInvoiceChanged(self.onInvoiceChanged)
+        updatesignal.connectInvoiceRemoved(self.onInvoiceRemoved)
+
+
+    def fetchInvoices(self):
+        #Called in the refresh worker thread
+        #Returns the invoices, None if not connected, or
+        #False if there is no need to update.
+        if self.haveInvoices and self.backend.pushesInvoiceUpdates():
+            #The list is kept up to date by onInvoiceChanged.
+            #After a connection loss, it needs to be reloaded.
+            return False if self.backend.isConnected() else None
 
-    def update(self):
         try:
-            invoices = self.backend.getInvoices()
-            haveData = True
+            return tuple(self.backend.getInvoices())
         except self.backend.NotConnected:
+            return None
+
+
+    def showInvoices(self, invoices):
+        if invoices is False:
+            return
+        haveData = invoices is not None
+        if not haveData:
             invoices = []
-            haveData = False
-            self.expirationLabel.setText('')
-            self.labelLabel.setText('')
-            self.amountLabel.setText('')
-            self.statusLabel.setText('')
-            self.descriptionLabel.setText('')
-            self.bolt11Label.setText('')
-            self.QRCode.clear()
+            self.clearDetails()
 
         self.invoiceTable.updateInvoices(invoices)
+        self.haveInvoices = haveData
         self.setEnabled(haveData)
 
 
+    def onInvoiceChanged(self, invoice):
+        if self.haveInvoices:
+            self.invoiceTable.updateInvoice(invoice)
+
+
+    def onInvoiceRemoved(self, invoice):
+        if self.haveInvoices:
+            self.invoiceTable.removeInvoice(invoice)
+
+
+    def clearDetails(self):
+        self.expirationLabel.setText('')
+        self.labelLabel.setText('')
+        self.amountLabel.setText('')
+        self.statusLabel.setText('')
+        self.descriptionLabel.setText('')
+        self.bolt11Label.setText('')
+        self.QRCode.clear()
+
+
     def onSelectInvoice(self, selected, deselected):
         rows = set()
         for index in selected.indexes():
             rows.add(index.row())
         if len(rows) != 1:
-            self.expirationLabel.setText('')
-            self.labelLabel.setText('')
-            self.amountLabel.setText('')
-            self.statusLabel.setText('')
-            self.descriptionLabel.setText('')
-            self.bolt11Label.setText('')
-            self.QRCode.clear()
+            self.clearDetails()
             return
 
         row = tuple(rows)[0]
@@ -232,8 +261,8 @@ class Invoices(QWidget):
         #Make a label that does not exist yet
         existingLabels = \
         set([
-        self.invoiceTable.getInvoice(i).label
-        for i in range(self.invoiceTable.rowCount(None))
+        invoice.label
+        for invoice in self.invoiceTable.dataList
         ])
         counter = 1
         newLabel = 'Invoice %d' % counter
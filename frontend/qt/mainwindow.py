@@ -49,6 +49,8 @@ class TabWidget(QWidget):
     def onCurrentChanged(self, index):
         if index < len(self.subWidgets):
             self.subWidgets[index].setFocus()
+            #Hidden tabs aren't refreshed, so this one may be out of date:
+            updatesignal.updateWidget(self.subWidgets[index])
 
 
 
@@ -90,20 +92,24 @@ class MainWindow(QMainWindow):
         aboutButton.triggered.connect(self.showAbout)
         helpMenu.addAction(aboutButton)
 
-        updatesignal.connect(self.update)
+        updatesignal.connectFetch(self.fetchStatus, self.showStatus,
+            self, freshness=1.0, cost=0.5,
+            methods=('isConnected', 'getBackendName'))
 
         self.show()
 
 
-    def update(self):
+    def fetchStatus(self):
+        #Called in the refresh worker thread
         if self.backend.isConnected():
             try:
-                status = 'Connected to %s' % self.backend.getBackendName()
+                return 'Connected to %s' % self.backend.getBackendName()
             except self.backend.NotConnected:
-                status = 'Not connected'
-        else:
-            status = 'Not connected'
+                pass
+        return 'Not connected'
 
+
+    def showStatus(self, status):
         self.statusLabel.setText(status)
 
 
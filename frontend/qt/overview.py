@@ -111,19 +111,25 @@ class Overview(QWidget):
             ])
         layout.addWidget(self.receiveFrame, 0, Qt.AlignTop)
 
-        updatesignal.connect(self.update)
+        updatesignal.connectFetch(self.fetchFunds, self.showFunds,
+            self, freshness=1.0, cost=1.0,
+            methods=('getFunds', 'getNativeCurrency'))
 
         self.setLayout(layout)
 
 
-    def update(self):
+    def fetchFunds(self):
+        #Called in the refresh worker thread
         try:
-            nonChannelFunds = self.backend.getNonChannelFunds()
-            channelFunds = self.backend.getChannelFunds()
+            nonChannelFunds, channelFunds = self.backend.getFunds()
             currency = self.backend.getNativeCurrency()
-            haveData = True
         except self.backend.NotConnected:
-            haveData = False
+            return None
+        return nonChannelFunds, tuple(channelFunds), currency
+
+
+    def showFunds(self, funds):
+        haveData = funds is not None
 
         self.sendFrame.setEnabled(haveData)
         self.lockedFrame.setEnabled(haveData)
@@ -131,6 +137,7 @@ class Overview(QWidget):
 
         if not haveData:
             return
+        nonChannelFunds, channelFunds, currency = funds
 
         confirmed   = sum(x[0] for x in nonChannelFunds.values() if x[1])
         unconfirmed = sum(x[0] for x in nonChannelFunds.values() if not x[1])
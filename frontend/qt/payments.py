@@ -15,27 +15,29 @@
 #    You should have received a copy of the GNU General Public License
 #    along with Fireworks. If not, see <http://www.gnu.org/licenses/>.
 
-import copy
-
 from PyQt5.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QGridLayout, QLabel, QPushButton, QTableView, QHeaderView, QSizePolicy
-from PyQt5.QtCore import Qt, QAbstractTableModel
+from PyQt5.QtCore import Qt
 
 from . import updatesignal
 from .. import formatting
 from .newpaymentdialog import NewPaymentDialog
+from .sortedtable import SortedTableModel
 
 
 
-class PaymentTable(QAbstractTableModel):
+class PaymentTable(SortedTableModel):
     def __init__(self, parent):
         super().__init__(parent)
         self.header = \
             ['Date', 'Label', 'Amount', 'Status']
-        self.dataList = []
 
 
-    def rowCount(self, parent):
-        return len(self.dataList)
+    def getKey(self, payment):
+        return payment.label
+
+
+    def getSortKey(self, payment):
+        return payment.timestamp
 
 
     def columnCount(self, parent):
@@ -73,16 +75,7 @@ class PaymentTable(QAbstractTableModel):
 
 
     def updatePayments(self, payments):
-        oldDataList = self.dataList
-
-        newDataList = copy.deepcopy(payments)
-        newDataList.sort(key=lambda x: x.timestamp)
-        newDataList.reverse()
-
-        if newDataList != oldDataList:
-            self.beginResetModel()
-            self.dataList = newDataList
-            self.endResetModel()
+        self.updateItems(payments)
 
 
 
@@ -156,16 +149,23 @@ class Payments(QWidget):
 
         self.setLayout(layout)
 
-        updatesignal.connect(self.update)
+        updatesignal.connectFetch(self.fetchPayments, self.showPayments,
+            self, freshness=1.0, cost=1.0,
+            methods=('getPayments',))
 
 
-    def update(self):
+    def fetchPayments(self):
+        #Called in the refresh worker thread
         try:
-            payments = self.backend.getPayments()
-            haveData = True
+            return tuple(self.backend.getPayments())
         except self.backend.NotConnected:
+            return None
+
+
+    def showPayments(self, payments):
+        haveData = payments is not None
+        if not haveData:
             payments = []
-            haveData = False
             self.dateLabel.setText('')
             self.labelLabel.setText('')
             self.amountLabel.setText('')
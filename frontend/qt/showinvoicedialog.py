@@ -80,30 +80,64 @@ class ShowInvoiceDialog(QDialog):
 
         self.setLayout(layout)
 
-        updatesignal.connect(self.update)
-        self.update()
+        self.haveInvoice = False
 
+        updatesignal.connectFetch(self.fetchInvoice, self.showFetchedInvoice,
+            self, freshness=1.0, cost=0.5,
+            methods=('getInvoices',))
+        updatesignal.connectInvoiceChanged(self.onInvoiceChanged)
+        updatesignal.connectInvoiceRemoved(self.onInvoiceRemoved)
+
+        #Fill in the data before the dialog is shown:
+        self.showFetchedInvoice(self.fetchInvoice())
+
+
+    def fetchInvoice(self):
+        #Called in the refresh worker thread
+        #Returns the invoice, a status message if it is not available, or
+        #None if there is no need to update.
+        if self.haveInvoice and self.backend.pushesInvoiceUpdates():
+            return None #Kept up to date by onInvoiceChanged
 
-    def update(self):
         try:
             invoices = self.backend.getInvoices()
         except self.backend.NotConnected:
-            self.statusLabel.setText('Unknown (not connected to backend)')
-            return
+            return 'Unknown (not connected to backend)'
 
         for invoice in invoices:
             if invoice.bolt11 == self.bolt11:
-                self.amountLabel.setText(
-                    formatting.formatAmount(invoice.data.amount, invoice.data.currency))
-                self.expirationLabel.setText(
-                    formatting.formatTimestamp(invoice.data.expirationTime))
-                self.statusLabel.setText(invoice.status)
-
-                #TODO: grey out the dialog if the invoice is expired
-
-                return
+                return invoice
 
         #Fall through: apparently it's not in the list
         #If this ever happens, I think it indicates a bug in the backend.
-        self.statusLabel.setText('Unknown (Invoice does not exist anymore?)')
+        return 'Unknown (Invoice does not exist anymore?)'
+
+
+    def showFetchedInvoice(self, invoice):
+        if invoice is None:
+            return
+        if isinstance(invoice, str):
+            self.statusLabel.setText(invoice)
+            return
+        self.showInvoice(invoice)
+
+
+    def onInvoiceChanged(self, invoice):
+        if invoice.bolt11 == self.bolt11:
+            self.showInvoice(invoice)
+
+
+    def onInvoiceRemoved(self, invoice):
+        if invoice.bolt11 == self.bolt11:
+            self.statusLabel.setText('Unknown (Invoice does not exist anymore?)')
+
+
+    def showInvoice(self, invoice):
+        self.amountLabel.setText(
+            formatting.formatAmount(invoice.data.amount, invoice.data.currency))
+        self.expirationLabel.setText(
+            formatting.formatTimestamp(invoice.data.expirationTime))
+        self.statusLabel.setText(invoice.status)
+        self.haveInvoice = True
 
+        #TODO: grey out the dialog if the invoice is expired
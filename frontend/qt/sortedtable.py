@@ -0,0 +1,185 @@
+#    Copyright (C) 2018 by Bitonic B.V.
+#
+#    This file is part of Fireworks.
+#
+#    Fireworks is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Fireworks is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Fireworks. If not, see <http://www.gnu.org/licenses/>.
+
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex
+
+
+
+class SortedTableModel(QAbstractTableModel):
+    '''
+    Table model of items that are identified by a key, and that are shown
+    in descending order of a (numeric) sort key.
+
+    Updates are applied as a diff: only changed rows are inserted, removed
+    or updated, so the selection and scroll position are kept. The items
+    are frozen Structs, so they are stored without copying them.
+
+    Rows are shown to the view in pages (see canFetchMore and fetchMore),
+    so the view only has to deal with the rows that were scrolled to.
+
+    Derived classes must implement getKey, getSortKey, columnCount
+    and data.
+    '''
+
+    pageSize = 100
+
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.dataList = []
+        self.shownRows = 0 #rows known to the view: the first ones of dataList
+
+
+    def getKey(self, item):
+        raise NotImplementedError()
+
+
+    def getSortKey(self, item):
+        raise NotImplementedError()
+
+
+    def rowCount(self, parent):
+        return self.shownRows
+
+
+    def canFetchMore(self, parent):
+        if parent.isValid():
+            return False
+        return self.shownRows < len(self.dataList)
+
+
+    def fetchMore(self, parent):
+        if parent.isValid():
+            return
+        count = min(self.pageSize, len(self.dataList) - self.shownRows)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self.shownRows, self.shownRows + count - 1)
+        self.shownRows += count
+        self.endInsertRows()
+
+
+    def updateItems(self, items):
+        '''
+        Arguments:
+            items: iterable
+                The complete new contents, in any order
+        '''
+        newItems = {self.getKey(x): x for x in items}
+
+        if not self.dataList or not newItems:
+            #Nothing to keep: a reset is cheaper than a diff
+            self.beginResetModel()
+            self.dataList = sorted(newItems.values(),
+                key=self.getSortKey, reverse=True)
+            self.shownRows = min(self.pageSize, len(self.dataList))
+            self.endResetModel()
+            return
+
+        #Remove rows that are gone, or whose position may have changed:
+        for row in reversed(range(len(self.dataList))):
+            old = self.dataList[row]
+            new = newItems.get(self.getKey(old))
+            if new is None or self.getSortKey(new) != self.getSortKey(old):
+                self.removeItem(row)
+
+        #Update changed rows:
+        for row, old in enumerate(self.dataList):
+            new = newItems.pop(self.getKey(old))
+            if new is not old and new != old:
+                self.dataList[row] = new
+                self.emitRowChanged(row)
+
+        #Insert the remaining items:
+        for item in newItems.values():
+            self.insertItem(item)
+
+
+    def updateItem(self, item):
+        '''
+        Adds a new item, or replaces the item with the same key.
+        Arguments:
+            item: any
+        '''
+        key = self.getKey(item)
+        for row, old in enumerate(self.dataList):
+            if self.getKey(old) != key:
+                continue
+            if self.getSortKey(old) == self.getSortKey(item):
+                self.dataList[row] = item
+                self.emitRowChanged(row)
+                return
+            self.removeItem(row)
+            break
+
+        self.insertItem(item)
+
+
+    def removeItemByKey(self, key):
+        '''
+        Removes the item with the given key, if it exists.
+        Arguments:
+            key: any
+        '''
+        for row, old in enumerate(self.dataList):
+            if self.getKey(old) == key:
+                self.removeItem(row)
+                return
+
+
+    def insertItem(self, item):
+        #Binary search for the row; negated, since the order is descending.
+        #Equal sort keys: insert after the existing ones.
+        sortKey = -self.getSortKey(item)
+        lo, hi = 0, len(self.dataList)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if -self.getSortKey(self.dataList[mid]) <= sortKey:
+                lo = mid + 1
+            else:
+                hi = mid
+        row = lo
+
+        #Rows after the shown ones are not known to the view.
+        #If all rows are shown, a row added at the end is shown too.
+        if row >= self.shownRows and self.shownRows < len(self.dataList):
+            self.dataList.insert(row, item)
+            return
+
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.dataList.insert(row, item)
+        self.shownRows += 1
+        self.endInsertRows()
+
+
+    def removeItem(self, row):
+        if row >= self.shownRows:
+            del self.dataList[row]
+            return
+
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.dataList[row]
+        self.shownRows -= 1
+        self.endRemoveRows()
+
+
+    def emitRowChanged(self, row):
+        if row >= self.shownRows:
+            return
+        self.dataChanged.emit(
+            self.index(row, 0), self.index(row, self.columnCount(None)-1))
+
@@ -15,40 +15,245 @@
 #    You should have received a copy of the GNU General Public License
 #    along with Fireworks. If not, see <http://www.gnu.org/licenses/>.
 
+import logging
+import queue
+import threading
+import time
+
 from PyQt5 import QtCore
 
 
 
+#Granularity of the refresh scheduling, in milliseconds
+TICK_INTERVAL = 250
+
+#While its data doesn't change, the interval of a fetcher is doubled on every
+#refresh, up to freshness * cost * MAX_STRETCH.
+MAX_STRETCH = 8
+
+
 class Updater(QtCore.QObject):
-    signal = QtCore.pyqtSignal()
+    invoiceSignal = QtCore.pyqtSignal(object)
+    invoiceRemovedSignal = QtCore.pyqtSignal(object)
+    resultSignal = QtCore.pyqtSignal(object)
+    refreshDoneSignal = QtCore.pyqtSignal()
+
+
+    def connectInvoiceChanged(self, slot):
+        self.invoiceSignal.connect(slot)
+
+
+    def invoiceChanged(self, invoice):
+        self.invoiceSignal.emit(invoice)
+
+
+    def connectInvoiceRemoved(self, slot):
+        self.invoiceRemovedSignal.connect(slot)
+
+
+    def invoiceRemoved(self, invoice):
+        self.invoiceRemovedSignal.emit(invoice)
+
 
 
-    def connect(self, slot):
-        self.signal.connect(slot)
+class Fetcher:
+    def __init__(self, fetch, slot, widget, freshness, cost, methods):
+        self.fetch = fetch
+        self.slot = slot
+        self.widget = widget
+        self.methods = methods
+        self.freshness = freshness
+        self.maxInterval = max(freshness, freshness * cost * MAX_STRETCH)
 
+        self.interval = freshness
+        self.lastStart = None    #time.monotonic() value, or None to run ASAP
+        self.lastApplied = 0     #generation of the last applied result
+        self.lastResult = object() #never equal to a real result
 
-    def update(self):
-        self.signal.emit()
+
+    def isDue(self, now):
+        #Hidden widgets are not refreshed; see updateWidget.
+        if self.widget is not None and not self.widget.isVisible():
+            return False
+        if self.lastStart is None:
+            return True
+        return now - self.lastStart >= self.interval
+
+
+    def reset(self):
+        self.interval = self.freshness
+        self.lastStart = None
+
+
+    def setResult(self, result):
+        #Returns whether the result is different from the previous one.
+        if result == self.lastResult:
+            self.interval = min(2 * self.interval, self.maxInterval)
+            return False
+
+        self.interval = self.freshness
+        self.lastResult = result
+        return True
 
 
 
 timer = QtCore.QTimer()
 updater = Updater()
 
+#Back-end I/O is done by the refresh worker thread.
+#All other state is only accessed from the GUI thread.
+refreshStartFunctions = []
+fetchers = []
+generation = 0
+refreshBusy = False
+refreshPending = False
+refreshQueue = queue.Queue()
+
 
 
 def initTimer():
-    timer.timeout.connect(updater.update)
+    timer.timeout.connect(onTick)
+    updater.resultSignal.connect(onResult)
+    updater.refreshDoneSignal.connect(onRefreshDone)
+    threading.Thread(target=runRefreshWorker, daemon=True).start()
+    timer.start(TICK_INTERVAL)
 
 
-def setUpdateInterval(ms):
-    timer.start(ms)
+def update():
+    #To be called after user actions: refresh everything as soon as possible,
+    #and go back to the shortest refresh intervals.
+    for f in fetchers:
+        f.reset()
+    refreshSoon()
 
 
-def update():
-    updater.update()
+def updateWidget(widget):
+    #To be called when widget becomes visible: refresh the fetchers of
+    #widget and its children as soon as possible.
+    for f in fetchers:
+        if f.widget is not None and \
+            (f.widget is widget or widget.isAncestorOf(f.widget)):
+            f.reset()
+    refreshSoon()
+
+
+def connectRefreshStart(function):
+    #function(methods) is called in the worker thread at the start of every
+    #refresh, with the set of back-end methods of the fetchers that are due.
+    refreshStartFunctions.append(function)
+
+
+def connectFetch(fetch, slot, widget=None, freshness=1.0, cost=1.0, methods=()):
+    '''
+    Periodically, fetch is called in the worker thread, and slot is
+    called in the GUI thread with the result of fetch, if it changed.
+    Arguments:
+        fetch: function() -> result
+            Should only read from the back-end; not touch any widgets.
+        slot: function(result)
+        widget: None or QWidget
+            If given, fetching is suspended while it is hidden.
+        freshness: float
+            Desired interval between fetches, in seconds
+        cost: float
+            Relative cost of a fetch (1 = typical). Costlier fetches are
+            done less often while their results don't change.
+        methods: iterable of str
+            Names of the back-end methods used by fetch, so their data can
+            be prefetched at the start of a refresh (see connectRefreshStart).
+    '''
+    fetchers.append(Fetcher(fetch, slot, widget, freshness, cost, methods))
+
+
+def connectInvoiceChanged(slot):
+    updater.connectInvoiceChanged(slot)
+
+
+def invoiceChanged(invoice):
+    #May be called from any thread: the slots are called in the GUI thread.
+    updater.invoiceChanged(invoice)
+
+
+def connectInvoiceRemoved(slot):
+    updater.connectInvoiceRemoved(slot)
+
+
+def invoiceRemoved(invoice):
+    #May be called from any thread: the slots are called in the GUI thread.
+    updater.invoiceRemoved(invoice)
+
+
+def refreshSoon():
+    global refreshPending
+    if refreshBusy:
+        refreshPending = True
+    else:
+        onTick()
+
+
+def onTick():
+    #A refresh never overlaps with the previous one:
+    if refreshBusy:
+        return
+
+    now = time.monotonic()
+    jobs = [(i, f.fetch) for i, f in enumerate(fetchers) if f.isDue(now)]
+    if not jobs:
+        return
+    for i, fetch in jobs:
+        fetchers[i].lastStart = now
+    startRefresh(jobs)
+
+
+def startRefresh(jobs):
+    global generation, refreshBusy, refreshPending
+    generation += 1
+    refreshBusy = True
+    refreshPending = False
+    methods = set()
+    for index, fetch in jobs:
+        methods.update(fetchers[index].methods)
+    refreshQueue.put((generation, jobs, methods))
+
+
+def runRefreshWorker():
+    #Runs in the worker thread.
+    while True:
+        thisGeneration, jobs, methods = refreshQueue.get()
+
+        for function in refreshStartFunctions:
+            try:
+                function(methods)
+            except Exception:
+                logging.exception('Error at the start of a refresh')
+
+        for index, fetch in jobs:
+            try:
+                result = fetch()
+            except Exception:
+                logging.exception('Error while fetching data')
+                continue
+            updater.resultSignal.emit((thisGeneration, index, result))
+
+        updater.refreshDoneSignal.emit()
+
+
+def onResult(item):
+    thisGeneration, index, result = item
+    fetcher = fetchers[index]
+
+    #Drop results that are older than what is already shown:
+    if fetcher.lastApplied > thisGeneration:
+        return
+    fetcher.lastApplied = thisGeneration
+
+    if fetcher.setResult(result):
+        fetcher.slot(result)
 
 
-def connect(slot):
-    updater.connect(slot)
+def onRefreshDone():
+    global refreshBusy
+    refreshBusy = False
+    if refreshPending:
+        onTick()
 
@@ -15,9 +15,12 @@
 #    You should have received a copy of the GNU General Public License
 #    along with Fireworks. If not, see <http://www.gnu.org/licenses/>.
 
+from collections import OrderedDict
 import logging
+import threading
 
 from PyQt5.QtWidgets import QFrame, QTextEdit, QLabel
+from PyQt5.QtCore import QObject, pyqtSignal
 from PyQt5 import QtGui
 
 
@@ -53,33 +56,139 @@ class BigLabel(QTextEdit):
 
 
 
+def makeQRImage(text, boxSize, border):
+    '''
+    Arguments:
+        text: str
+        boxSize: int
+            Size of a QR module, in pixels
+        border: int
+            Size of the border, in QR modules
+    Returns: QImage, or None if QR codes are not supported
+    '''
+    try:
+        from qrcode import QRCode
+    except ImportError as e:
+        logging.warning('Cannot display QR codes: ' + str(e))
+        return None
+
+    qr = QRCode(
+            box_size = boxSize,
+            border = border,
+            )
+    qr.add_data(text)
+    qr.make()
+    matrix = qr.get_matrix() #includes the border
+
+    #Directly to an 8-bit grayscale image; no need for PIL.
+    #Image lines must be 32-bit aligned.
+    size = len(matrix) * boxSize
+    bytesPerLine = (size + 3) // 4 * 4
+    padding = b'\xff' * (bytesPerLine - size)
+    black = b'\x00' * boxSize
+    white = b'\xff' * boxSize
+    data = b''.join(
+        (b''.join(black if module else white for module in row) + padding) * boxSize
+        for row in matrix
+        )
+
+    image = QtGui.QImage(data, size, size, bytesPerLine, QtGui.QImage.Format_Grayscale8)
+    return image.copy() #so it no longer refers to data
+
+
+
+class QRRenderer(QObject):
+    '''
+    Renders QR codes in a background thread.
+    '''
+    imageReady = pyqtSignal(object, str, object)
+
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.requests = {} #QRCode -> text; only the latest request of each
+        self.requestEvent = threading.Event()
+        self.imageReady.connect(self.onImageReady)
+        threading.Thread(target=self.run, daemon=True).start()
+
+
+    def render(self, requester, text, boxSize, border):
+        with self.lock:
+            self.requests[requester] = (text, boxSize, border)
+        self.requestEvent.set()
+
+
+    def run(self):
+        #Runs in the background thread.
+        while True:
+            self.requestEvent.wait()
+            with self.lock:
+                requests = self.requests
+                self.requests = {}
+                self.requestEvent.clear()
+
+            for requester, (text, boxSize, border) in requests.items():
+                #One failure (e.g. too much data) must not stop the renderer:
+                try:
+                    image = makeQRImage(text, boxSize, border)
+                except Exception:
+                    logging.exception('Could not render QR code')
+                    continue
+                if image is not None:
+                    self.imageReady.emit(requester, text, image)
+
+
+    def onImageReady(self, requester, text, image):
+        #Called in the GUI thread.
+        requester.onImageReady(text, image)
+
+
+
 class QRCode(QLabel):
+    boxSize = 4
+    border = 4
+
+    #Shared by all instances; text -> QPixmap
+    cacheSize = 100
+    pixmapCache = OrderedDict()
+
+    renderer = None #created on first use, in the GUI thread
+
+
     def __init__(self, parent):
         super().__init__(parent)
+        self.qrText = None
 
 
     def setQRCode(self, text):
-        try:
-            from qrcode import QRCode
-            from PIL.ImageQt import ImageQt
+        self.qrText = text
 
-            qr = QRCode(
-                    box_size = 4,
-                    border = 4,
-                    )
-            qr.add_data(text)
-            qr.make()
+        pixmap = self.pixmapCache.get(text)
+        if pixmap is not None:
+            self.pixmapCache.move_to_end(text)
+            self.setPixmap(pixmap)
+            return
+
+        #Don't show the old code next to the new data while rendering:
+        self.setText('')
+        if QRCode.renderer is None:
+            QRCode.renderer = QRRenderer()
+        QRCode.renderer.render(self, text, self.boxSize, self.border)
 
-            img = qr.make_image()
-            img = ImageQt(img)
-            img = QtGui.QPixmap.fromImage(img)
 
-            self.setPixmap(img)
+    def onImageReady(self, text, image):
+        pixmap = QtGui.QPixmap.fromImage(image)
+        self.pixmapCache[text] = pixmap
+        while len(self.pixmapCache) > self.cacheSize:
+            self.pixmapCache.popitem(last=False)
 
-        except ImportError as e:
-            logging.warning('Cannot display QR codes: ' + str(e))
+        #Ignore if another code has been set in the mean time:
+        if text == self.qrText:
+            self.setPixmap(pixmap)
 
 
     def clear(self):
+        self.qrText = None
         self.setText('')
 
@@ -0,0 +1,351 @@
+#    Copyright (C) 2018 by Bitonic B.V.
+#
+#    This file is part of Fireworks.
+#
+#    Fireworks is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Fireworks is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Fireworks. If not, see <http://www.gnu.org/licenses/>.
+
+#Offline decoding of BOLT 11 payment requests.
+#See https://github.com/lightningnetwork/lightning-rfc/blob/master/11-payment-encoding.md
+
+import functools
+import hashlib
+import re
+
+from backend.backend_base import Backend
+from utils.currencies import currencyInfo
+
+
+
+BECH32_CHARSET = 'qpzry9x8gf2tvdw0s3jn54khce6mua7l'
+
+#Tagged field types:
+TAG_PAYMENT_HASH  = 1
+TAG_DESCRIPTION   = 13
+TAG_PAYEE         = 19
+TAG_EXPIRY        = 6
+TAG_MIN_FINAL_CLTV_EXPIRY = 24
+
+DEFAULT_EXPIRY = 3600
+DEFAULT_MIN_FINAL_CLTV_EXPIRY = 9
+
+#mSatoshi per unit of the amount, for each multiplier:
+AMOUNT_MULTIPLIERS = \
+{
+''  : 100000000000,
+'m' :    100000000,
+'u' :       100000,
+'n' :          100,
+}
+
+#secp256k1 curve parameters
+CURVE_P = 2**256 - 2**32 - 977
+CURVE_N = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+CURVE_G = (
+    0x79BE667EF9DCBBAC55A06295CE870B07029BFCDB2DCE28D959F2815B16F81798,
+    0x483ADA7726A3C4655DA4FBFC0E1108A8FD17B448A68554199C47D08FFB10D4B8
+    )
+
+#Size of the decoding cache (number of payment requests)
+CACHE_SIZE = 4096
+
+
+
+def bech32Polymod(values):
+    generator = [0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3]
+    chk = 1
+    for v in values:
+        b = chk >> 25
+        chk = (chk & 0x1ffffff) << 5 ^ v
+        for i in range(5):
+            chk ^= generator[i] if ((b >> i) & 1) else 0
+    return chk
+
+
+def bech32Decode(text):
+    '''
+    Arguments:
+        text: str
+    Returns: tuple(str, list(int))
+        The human-readable part and the 5-bit data words,
+        without the checksum.
+    Exceptions:
+        ValueError: invalid bech32 string
+    '''
+    if text.lower() != text and text.upper() != text:
+        raise ValueError('Mixed-case bech32 string')
+    text = text.lower()
+
+    pos = text.rfind('1')
+    if pos < 1 or pos + 7 > len(text):
+        raise ValueError('Invalid bech32 separator position')
+
+    hrp = text[:pos]
+    if any(ord(c) < 33 or ord(c) > 126 for c in hrp):
+        raise ValueError('Invalid character in bech32 human-readable part')
+
+    try:
+        data = [BECH32_CHARSET.index(c) for c in text[pos+1:]]
+    except ValueError:
+        raise ValueError('Invalid character in bech32 data part')
+
+    expandedHRP = [ord(c) >> 5 for c in hrp] + [0] + [ord(c) & 31 for c in hrp]
+    if bech32Polymod(expandedHRP + data) != 1:
+        raise ValueError('Invalid bech32 checksum')
+
+    return hrp, data[:-6]
+
+
+def wordsToBytes(words):
+    #Converts 5-bit words to bytes; any remaining bits are zero-padded.
+    acc = 0
+    bits = 0
+    ret = bytearray()
+    for w in words:
+        acc = (acc << 5) | w
+        bits += 5
+        while bits >= 8:
+            bits -= 8
+            ret.append((acc >> bits) & 0xff)
+    if bits > 0:
+        ret.append((acc << (8 - bits)) & 0xff)
+    return bytes(ret)
+
+
+def wordsToInt(words):
+    ret = 0
+    for w in words:
+        ret = (ret << 5) | w
+    return ret
+
+
+def pointAdd(p1, p2):
+    #Addition of points in Jacobian coordinates; None is the point at infinity
+    if p1 is None:
+        return p2
+    if p2 is None:
+        return p1
+    P = CURVE_P
+    X1, Y1, Z1 = p1
+    X2, Y2, Z2 = p2
+    Z1Z1 = Z1 * Z1 % P
+    Z2Z2 = Z2 * Z2 % P
+    U1 = X1 * Z2Z2 % P
+    U2 = X2 * Z1Z1 % P
+    S1 = Y1 * Z2 * Z2Z2 % P
+    S2 = Y2 * Z1 * Z1Z1 % P
+    if U1 == U2:
+        if S1 != S2:
+            return None
+        return pointDouble(p1)
+    H = (U2 - U1) % P
+    R = (S2 - S1) % P
+    H2 = H * H % P
+    H3 = H * H2 % P
+    U1H2 = U1 * H2 % P
+    X3 = (R * R - H3 - 2 * U1H2) % P
+    Y3 = (R * (U1H2 - X3) - S1 * H3) % P
+    Z3 = H * Z1 * Z2 % P
+    return (X3, Y3, Z3)
+
+
+def pointDouble(p):
+    if p is None:
+        return None
+    P = CURVE_P
+    X, Y, Z = p
+    if Y == 0:
+        return None
+    YY = Y * Y % P
+    S = 4 * X * YY % P
+    M = 3 * X * X % P
+    X3 = (M * M - 2 * S) % P
+    Y3 = (M * (S - X3) - 8 * YY * YY) % P
+    Z3 = 2 * Y * Z % P
+    return (X3, Y3, Z3)
+
+
+def pointMultiply(k, point):
+    ret = None
+    addend = (point[0], point[1], 1)
+    while k:
+        if k & 1:
+            ret = pointAdd(ret, addend)
+        addend = pointDouble(addend)
+        k >>= 1
+    return ret
+
+
+def toAffine(p):
+    P = CURVE_P
+    X, Y, Z = p
+    Zinv = pow(Z, P - 2, P)
+    Zinv2 = Zinv * Zinv % P
+    return (X * Zinv2 % P, Y * Zinv2 * Zinv % P)
+
+
+def recoverPublicKey(messageHash, signature, recoveryID):
+    '''
+    Arguments:
+        messageHash: bytes
+            32-byte hash of the signed message
+        signature: bytes
+            64-byte compact signature (r, s)
+        recoveryID: int
+    Returns: str
+        The hex-encoded compressed public key
+    Exceptions:
+        ValueError: no public key can be recovered
+    '''
+    N = CURVE_N
+    P = CURVE_P
+    r = int.from_bytes(signature[:32], 'big')
+    s = int.from_bytes(signature[32:], 'big')
+    if not (0 < r < N and 0 < s < N) or not (0 <= recoveryID <= 3):
+        raise ValueError('Invalid signature')
+
+    x = r + (recoveryID >> 1) * N
+    if x >= P:
+        raise ValueError('Invalid signature')
+    alpha = (x * x * x + 7) % P
+    beta = pow(alpha, (P + 1) // 4, P)
+    if beta * beta % P != alpha:
+        raise ValueError('Invalid signature')
+    y = beta if beta % 2 == recoveryID % 2 else P - beta
+
+    e = int.from_bytes(messageHash, 'big')
+    rInv = pow(r, N - 2, N)
+    Q = pointAdd(
+        pointMultiply((-e * rInv) % N, CURVE_G),
+        pointMultiply((s * rInv) % N, (x, y))
+        )
+    if Q is None:
+        raise ValueError('Invalid signature')
+
+    x, y = toAffine(Q)
+    return ('03' if y % 2 else '02') + '%064x' % x
+
+
+def parseHRP(hrp):
+    #Returns currency and amount (mSatoshi; 0 if the payment request doesn't
+    #specify an amount, like in LND's DecodePayReq)
+    match = re.fullmatch(r'ln([a-z]+?)(?:([0-9]+)([munp]?))?', hrp)
+    if match is None:
+        raise ValueError('Invalid payment request prefix')
+    currency, amount, multiplier = match.groups()
+    if currency not in currencyInfo:
+        raise ValueError('Unsupported currency: ' + currency)
+
+    if amount is None:
+        return currency, 0
+    amount = int(amount)
+    if multiplier == 'p':
+        if amount % 10 != 0:
+            raise ValueError('Invalid sub-millisatoshi amount')
+        return currency, amount // 10
+    return currency, amount * AMOUNT_MULTIPLIERS[multiplier]
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def decode(bolt11, payee=None, verify=False):
+    '''
+    Decodes a payment request without contacting any node.
+    The result is cached; since InvoiceData is frozen, it can be shared.
+    Arguments:
+        bolt11: str
+        payee: None or str
+            If given, the payee is known to be this node ID (e.g. for our own
+            invoices), so it doesn't need to be recovered from the signature.
+        verify: bool
+            If True, check that the signature was made by the payee.
+    Returns: InvoiceData
+    Exceptions:
+        ValueError: invalid payment request
+    '''
+    hrp, words = bech32Decode(bolt11)
+    currency, amount = parseHRP(hrp)
+
+    #Signature (65 bytes = 104 words) at the end, timestamp (7 words) at the start
+    if len(words) < 7 + 104:
+        raise ValueError('Payment request is too short')
+    signatureWords = words[-104:]
+    words = words[:-104]
+    creationTime = wordsToInt(words[:7])
+
+    fields = {}
+    pos = 7
+    while pos < len(words):
+        if pos + 3 > len(words):
+            raise ValueError('Truncated tagged field')
+        tag = words[pos]
+        length = (words[pos+1] << 5) | words[pos+2]
+        pos += 3
+        if pos + length > len(words):
+            raise ValueError('Truncated tagged field')
+        fieldWords = words[pos:pos+length]
+        pos += length
+
+        #Only the first field of a kind counts; fields of the
+        #wrong length must be skipped.
+        if tag in fields:
+            continue
+        if tag == TAG_PAYMENT_HASH and length != 52:
+            continue
+        if tag == TAG_PAYEE and length != 53:
+            continue
+        fields[tag] = fieldWords
+
+    if TAG_PAYMENT_HASH not in fields:
+        raise ValueError('Payment request has no payment hash')
+
+    signature = wordsToBytes(signatureWords)
+    explicitPayee = None
+    if TAG_PAYEE in fields:
+        explicitPayee = wordsToBytes(fields[TAG_PAYEE])[:33].hex()
+
+    if verify or (payee is None and explicitPayee is None):
+        messageHash = hashlib.sha256(hrp.encode() + wordsToBytes(words)).digest()
+        recovered = recoverPublicKey(messageHash, signature[:64], signature[64])
+        if verify and recovered != (explicitPayee or payee or recovered):
+            raise ValueError('Payment request signature is not made by the payee')
+        if explicitPayee is None and payee is None:
+            payee = recovered
+    if explicitPayee is not None:
+        payee = explicitPayee
+
+    description = None
+    if TAG_DESCRIPTION in fields:
+        description = wordsToBytes(fields[TAG_DESCRIPTION])
+        description = description[:len(fields[TAG_DESCRIPTION]) * 5 // 8]
+        description = description.decode('utf-8', errors='replace')
+
+    expiry = DEFAULT_EXPIRY
+    if TAG_EXPIRY in fields:
+        expiry = wordsToInt(fields[TAG_EXPIRY])
+
+    minFinalCLTVExpiry = DEFAULT_MIN_FINAL_CLTV_EXPIRY
+    if TAG_MIN_FINAL_CLTV_EXPIRY in fields:
+        minFinalCLTVExpiry = wordsToInt(fields[TAG_MIN_FINAL_CLTV_EXPIRY])
+
+    return Backend.InvoiceData(
+        creationTime=creationTime,
+        expirationTime=creationTime + expiry,
+        min_final_cltv_expiry=minFinalCLTVExpiry,
+        amount=amount,
+        currency=currency,
+        description=description,
+        payee=payee,
+        paymentHash=wordsToBytes(fields[TAG_PAYMENT_HASH])[:32].hex(),
+        signature=signature[:64].hex()
+        )
+
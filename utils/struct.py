@@ -15,17 +15,138 @@
 #    You should have received a copy of the GNU General Public License
 #    along with Fireworks. If not, see <http://www.gnu.org/licenses/>.
 
-from functools import reduce
+import copy
+from operator import attrgetter
 
 
 
-class Struct:
+class StructMeta(type):
+    '''
+    Turns the class attributes of a Struct subclass into slots.
+    The field names and defaults are determined once per class.
+    '''
+    def __new__(mcs, name, bases, namespace, hashable=None, frozen=None):
+        defaults = {}
+        for base in reversed(bases):
+            defaults.update(getattr(base, '_defaults', {}))
+
+        newFields = \
+        [
+        k for k, v in namespace.items()
+        if not k.startswith('_') and not callable(v) and \
+            not isinstance(v, (staticmethod, classmethod, property))
+        ]
+        for k in newFields:
+            defaults[k] = namespace.pop(k)
+
+        namespace['__slots__'] = tuple(namespace.get('__slots__', ())) + \
+            tuple(newFields)
+        cls = super().__new__(mcs, name, bases, namespace)
+
+        cls._defaults = defaults
+        cls._fields = tuple(sorted(defaults.keys()))
+        if len(cls._fields) == 0:
+            cls._getValues = staticmethod(lambda obj: ())
+        elif len(cls._fields) == 1:
+            getter = attrgetter(cls._fields[0])
+            cls._getValues = staticmethod(lambda obj: (getter(obj),))
+        else:
+            cls._getValues = staticmethod(attrgetter(*cls._fields))
+        if frozen is not None:
+            cls._frozen = frozen
+            if frozen and hashable is None:
+                hashable = True
+        if hashable is not None:
+            cls._hashable = hashable
+
+        return cls
+
+
+    def __init__(cls, name, bases, namespace, **kwargs):
+        super().__init__(name, bases, namespace)
+
+
+
+class Struct(metaclass=StructMeta):
+    '''
+    Base class for simple data classes. Fields are declared as class
+    attributes, with their default values:
+
+    class Point(Struct):
+        x = 0
+        y = 0
+
+    Hash support can be enabled with class Point(Struct, hashable=True);
+    the hash is cached, so hashable instances must not be modified.
+
+    With class Point(Struct, frozen=True), instances can not be modified,
+    and are hashable. Use replace to get a modified copy. Frozen
+    instances can be shared between threads without copying.
+    '''
+    __slots__ = ('_hash',)
+    _hashable = False
+    _frozen = False
+
+
     def __init__(self, **kwargs):
-        self.__elementNames = [e for e in dir(self) if not e.startswith('__')]
+        defaults = self._defaults
         for k in kwargs:
-            if k not in self.__elementNames:
+            if k not in defaults:
                 raise KeyError('Key %s not in Struct' % k)
-            self.__dict__[k] = kwargs[k]
+        for k, v in defaults.items():
+            object.__setattr__(self, k, kwargs.get(k, v))
+        object.__setattr__(self, '_hash', None)
+
+
+    def __setattr__(self, name, value):
+        if self._frozen:
+            raise AttributeError(
+                'Can not set %s: %s is frozen' % (name, self.__class__.__name__))
+        object.__setattr__(self, name, value)
+
+
+    def __delattr__(self, name):
+        if self._frozen:
+            raise AttributeError(
+                'Can not delete %s: %s is frozen' % (name, self.__class__.__name__))
+        object.__delattr__(self, name)
+
+
+    def replace(self, **kwargs):
+        '''
+        Arguments:
+            **kwargs:
+                New values of fields.
+        Returns: Struct
+            A copy of this object, with the given fields replaced.
+        Exceptions:
+            KeyError: a key is not a field of this Struct
+        '''
+        values = dict(zip(self._fields, self._getValues(self)))
+        values.update(kwargs)
+        return self.__class__(**values)
+
+
+    def __getstate__(self):
+        return dict(zip(self._fields, self._getValues(self)))
+
+
+    def __setstate__(self, state):
+        for k, v in state.items():
+            object.__setattr__(self, k, v)
+        object.__setattr__(self, '_hash', None)
+
+
+    def __copy__(self):
+        if self._frozen:
+            return self
+        return self.__class__(**self.__getstate__())
+
+
+    def __deepcopy__(self, memo):
+        if self._frozen:
+            return self
+        return self.__class__(**copy.deepcopy(self.__getstate__(), memo))
 
 
     def __str__(self):
@@ -36,16 +157,27 @@ class Struct:
             self.__class__.__name__,
             ', '.join([
                 '%s=%s' % (k, repr(getattr(self, k)))
-                for k in self.__elementNames
+                for k in self._fields
                 ])
             )
 
 
     def __eq__(self, obj):
-        return obj.__class__ == self.__class__ and \
-            reduce(lambda x,y: x and y,
-                [
-                getattr(self, k) == getattr(obj, k)
-                for k in self.__elementNames
-                ])
+        if obj is self:
+            return True
+        if obj.__class__ is not self.__class__:
+            return False
+        if self._hash is not None and obj._hash is not None and \
+            self._hash != obj._hash:
+                return False
+        #Tuple comparison stops at the first difference:
+        return self._getValues(self) == self._getValues(obj)
+
+
+    def __hash__(self):
+        if not self._hashable:
+            raise TypeError('unhashable type: \'%s\'' % self.__class__.__name__)
+        if self._hash is None:
+            object.__setattr__(self, '_hash', hash(self._getValues(self)))
+        return self._hash
 
@@ -0,0 +1,81 @@
+#    Copyright (C) 2018 by Bitonic B.V.
+#
+#    This file is part of Fireworks.
+#
+#    Fireworks is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Fireworks is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Fireworks. If not, see <http://www.gnu.org/licenses/>.
+
+from collections import OrderedDict
+import threading
+import time
+
+
+
+class TTLCache:
+    '''
+    A thread-safe key->value cache, where entries expire after a fixed
+    time, and the least recently used entries are dropped when the
+    cache grows beyond its maximum size.
+    '''
+
+    def __init__(self, ttl, maxSize):
+        '''
+        Arguments:
+            ttl: float
+                Lifetime of an entry, in seconds
+            maxSize: int
+                Maximum number of entries
+        '''
+        self.ttl = ttl
+        self.maxSize = maxSize
+        self.lock = threading.Lock()
+        self.entries = OrderedDict() #key -> (expirationTime, value)
+
+
+    def get(self, key, default=None):
+        '''
+        Arguments:
+            key: hashable
+            default: any
+        Returns: any
+            The cached value, or default if not present or expired
+        '''
+        with self.lock:
+            try:
+                expirationTime, value = self.entries[key]
+            except KeyError:
+                return default
+            if expirationTime <= time.monotonic():
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return value
+
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+